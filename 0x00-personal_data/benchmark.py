@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the redaction strategies of filtered_logger on synthetic logs.
+"""
+from typing import Callable, Dict, List, Tuple
+import argparse
+import json
+import logging
+import random
+import re
+import string
+import sys
+import time
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, filter_datum
+
+
+# Columns of user_data.csv that hold no PII, used to pad synthetic lines
+OTHER_FIELDS = ('ip', 'last_login', 'user_agent')
+
+# Latency percentiles reported for every strategy
+PERCENTILES = (50, 90, 99)
+
+
+def generate_lines(count: int, field_count: int = 8, hit_ratio: float = 0.5,
+                   value_size: int = 16, seed: int = 0
+                   ) -> List[Tuple[str, Dict[str, str]]]:
+    """
+    Generates synthetic log lines shaped like the rows of user_data.csv.
+
+    Args:
+        count (int): Number of lines to generate.
+        field_count (int): Number of key=value pairs per line.
+        hit_ratio (float): Share of the pairs that hold a PII field, capped
+            by the number of PII_FIELDS.
+        value_size (int): Length of every value.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        list: (line, data) pairs, data being the pairs as a dict.
+    """
+    rng = random.Random(seed)
+    hits = min(int(round(field_count * hit_ratio)), len(PII_FIELDS))
+    keys = list(PII_FIELDS[:hits])
+    i = 0
+    while len(keys) < field_count:
+        if i < len(OTHER_FIELDS):
+            keys.append(OTHER_FIELDS[i])
+        else:
+            keys.append('extra_{}'.format(i))
+        i += 1
+
+    alphabet = string.ascii_letters + string.digits + ' .@-'
+    lines = []
+    for _ in range(count):
+        rng.shuffle(keys)
+        data = {k: ''.join(rng.choice(alphabet) for _ in range(value_size))
+                for k in keys}
+        line = "".join("{}={};".format(k, v) for k, v in data.items())
+        lines.append((line, data))
+    return lines
+
+
+def legacy_filter_datum(fields: List[str], redaction: str,
+                        message: str, separator: str) -> str:
+    """
+    Reference implementation running one re.sub per field.
+    """
+    for field in fields:
+        message = re.sub(field+'=.*?'+separator,
+                         field+'='+redaction+separator, message)
+    return message
+
+
+def _strategies() -> Dict[str, Callable[[str, Dict[str, str]], str]]:
+    """
+    Builds the redaction strategies under test, keyed by name.
+    """
+    formatter = RedactingFormatter(PII_FIELDS)
+    redaction = RedactingFormatter.REDACTION
+    separator = RedactingFormatter.SEPARATOR
+
+    def record(msg, args=None, data=None):
+        rec = logging.LogRecord("user_data", logging.INFO, __file__, 0,
+                                msg, args, None)
+        if data is not None:
+            rec.data = data
+        return rec
+
+    return {
+        'legacy': lambda line, data: legacy_filter_datum(
+            PII_FIELDS, redaction, line, separator),
+        'filter_datum': lambda line, data: filter_datum(
+            PII_FIELDS, redaction, line, separator),
+        'formatter': lambda line, data: formatter.format(record(line)),
+        'structured': lambda line, data: formatter.format(
+            record("", data=data)),
+    }
+
+
+STRATEGIES = tuple(_strategies())
+
+
+def run(strategy: str, lines: List[Tuple[str, Dict[str, str]]]) -> dict:
+    """
+    Redacts every line with one strategy and measures it.
+
+    Args:
+        strategy (str): One of STRATEGIES.
+        lines (list): Lines produced by generate_lines.
+
+    Returns:
+        dict: Throughput and latency percentiles of the run.
+    """
+    redact = _strategies()[strategy]
+    latencies = []
+    size = 0
+    clock = time.perf_counter
+    total = clock()
+    for line, data in lines:
+        start = clock()
+        redact(line, data)
+        latencies.append(clock() - start)
+        size += len(line)
+    total = clock() - total
+
+    latencies.sort()
+    result = {
+        'strategy': strategy,
+        'lines': len(lines),
+        'lines_per_sec': len(lines) / total if total else 0.0,
+        'bytes_per_sec': size / total if total else 0.0,
+    }
+    for p in PERCENTILES:
+        index = min(len(latencies) - 1, len(latencies) * p // 100)
+        result['p{}_us'.format(p)] = latencies[index] * 1e6
+    return result
+
+
+def main(argv: List[str]) -> int:
+    """
+    Command line entry point.
+
+    Args:
+        argv (list): Command line arguments, without the program name.
+
+    Returns:
+        int: 1 when a strategy falls below --min-rate, 0 otherwise.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-n', '--lines', type=int, default=10000)
+    parser.add_argument('-f', '--fields', type=int, default=8,
+                        help="key=value pairs per line")
+    parser.add_argument('-r', '--hit-ratio', type=float, default=0.5,
+                        help="share of the pairs holding PII")
+    parser.add_argument('-v', '--value-size', type=int, default=16)
+    parser.add_argument('-s', '--strategy', nargs='+', default=STRATEGIES,
+                        choices=STRATEGIES)
+    parser.add_argument('--min-rate', type=float, default=None,
+                        help="fail when lines/sec drops below this value")
+    parser.add_argument('--json', action='store_true',
+                        help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    lines = generate_lines(args.lines, args.fields, args.hit_ratio,
+                           args.value_size)
+    results = [run(strategy, lines) for strategy in args.strategy]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("{:<14}{:>14}{:>14}{:>10}{:>10}{:>10}".format(
+            'strategy', 'lines/s', 'MB/s', 'p50 us', 'p90 us', 'p99 us'))
+        for r in results:
+            print("{:<14}{:>14.0f}{:>14.2f}{:>10.1f}{:>10.1f}{:>10.1f}"
+                  .format(r['strategy'], r['lines_per_sec'],
+                          r['bytes_per_sec'] / 1e6, r['p50_us'],
+                          r['p90_us'], r['p99_us']))
+
+    if args.min_rate is not None:
+        slow = [r['strategy'] for r in results
+                if r['lines_per_sec'] < args.min_rate]
+        if slow:
+            print("below {} lines/s: {}".format(args.min_rate,
+                                                ', '.join(slow)),
+                  file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -2,16 +2,44 @@
 """
 Defines functions to hash passwords and verify validity.
 """
+import asyncio
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Callable, Iterable, List, Optional, Tuple
+
 import bcrypt
 from bcrypt import hashpw
 
 
-def hash_password(password: str) -> bytes:
+# Default number of threads used by the batch functions
+WORKERS = os.cpu_count() or 1
+
+# Verification latency targeted by calibrate_rounds, in seconds
+TARGET_VERIFY_SECONDS = 0.05
+
+# Range of work factors accepted by bcrypt
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+
+# Lowest work factor calibrate_rounds may select, however slow the host
+SAFE_MIN_ROUNDS = 10
+
+# Work factor of new hashes, bcrypt's default when None; set it to
+# default_rounds() to follow TARGET_VERIFY_SECONDS on this host
+ROUNDS = None
+
+
+def hash_password(password: str, rounds: int = None) -> bytes:
     """
     Hashes the password using bcrypt and returns the hashed result.
 
     Args:
         password (str): The plain-text password to hash.
+        rounds (int): bcrypt work factor, ROUNDS or bcrypt's default if
+            None.
 
     Returns:
         bytes: The hashed password.
@@ -20,7 +48,13 @@ def hash_password(password: str) -> bytes:
     b = password.encode()
 
     # Generate the hashed password using bcrypt
-    hashed = hashpw(b, bcrypt.gensalt())
+    if rounds is None:
+        rounds = ROUNDS
+    if rounds is None:
+        salt = bcrypt.gensalt()
+    else:
+        salt = bcrypt.gensalt(rounds)
+    hashed = hashpw(b, salt)
 
     return hashed
 
@@ -38,3 +72,338 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
     """
     # Compare the password with the stored hashed password
     return bcrypt.checkpw(password.encode(), hashed_password)
+
+
+def calibrate_rounds(target: float = TARGET_VERIFY_SECONDS,
+                     floor: int = SAFE_MIN_ROUNDS) -> int:
+    """
+    Finds the highest work factor verifying within target on this host.
+
+    Each extra round doubles the cost, so factors are timed from floor
+    upwards until one exceeds the target.
+
+    Args:
+        target (float): Acceptable verification time in seconds.
+        floor (int): Lowest acceptable work factor.
+
+    Returns:
+        int: The selected work factor, at least floor.
+    """
+    b = b"calibration"
+    rounds = max(floor, MIN_ROUNDS)
+    while rounds < MAX_ROUNDS:
+        hashed = hashpw(b, bcrypt.gensalt(rounds + 1))
+        start = time.perf_counter()
+        bcrypt.checkpw(b, hashed)
+        if time.perf_counter() - start > target:
+            break
+        rounds += 1
+    return rounds
+
+
+_calibrated = None
+_calibrate_lock = threading.Lock()
+
+
+def default_rounds() -> int:
+    """
+    Returns the work factor calibrated for TARGET_VERIFY_SECONDS.
+
+    The calibration runs once per process; concurrent first callers wait
+    for it rather than timing bcrypt against each other.
+
+    Returns:
+        int: The calibrated work factor.
+    """
+    global _calibrated
+    with _calibrate_lock:
+        if _calibrated is None:
+            _calibrated = calibrate_rounds()
+        return _calibrated
+
+
+def target_rounds() -> int:
+    """
+    Returns the work factor of new and upgraded hashes.
+
+    Returns:
+        int: ROUNDS when set, the cost of bcrypt.gensalt() otherwise.
+    """
+    if ROUNDS is not None:
+        return ROUNDS
+    return hash_rounds(bcrypt.gensalt())
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """
+    Reads the work factor stored in a bcrypt hash.
+
+    Args:
+        hashed_password (bytes): A hash such as b"$2b$12$...".
+
+    Returns:
+        int: The work factor of the hash.
+    """
+    return int(hashed_password.split(b"$")[2])
+
+
+def verify_and_rehash(hashed_password: bytes, password: str,
+                      rounds: int = None) -> Tuple[bool, Optional[bytes]]:
+    """
+    Verifies a password and upgrades its hash to the target work factor.
+
+    Args:
+        hashed_password (bytes): The stored hashed password.
+        password (str): The plain-text password to verify.
+        rounds (int): Target work factor, target_rounds() if None.
+
+    Returns:
+        tuple: Whether the password matches, and the new hash to store
+        when it does and the stored work factor differs from the target
+        (None otherwise).
+    """
+    if not is_valid(hashed_password, password):
+        return False, None
+    if rounds is None:
+        rounds = target_rounds()
+    if hash_rounds(hashed_password) == rounds:
+        return True, None
+    return True, hash_password(password, rounds)
+
+
+def _run_batch(func: Callable, items: Iterable[tuple], workers: int,
+               timeout: float) -> list:
+    """
+    Applies func to every argument tuple on a thread pool, keeping order.
+
+    bcrypt releases the GIL while hashing, so the threads run in parallel.
+
+    Args:
+        func (callable): Function to apply.
+        items (iterable): Argument tuples, one per call.
+        workers (int): Number of threads, WORKERS by default.
+        timeout (float): Seconds to wait for each result.
+
+    Returns:
+        list: The results, in input order.
+    """
+    executor = ThreadPoolExecutor(max_workers=workers or WORKERS)
+    futures = [executor.submit(func, *args) for args in items]
+    try:
+        return [future.result(timeout=timeout) for future in futures]
+    except TimeoutError:
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=False)
+
+
+def hash_passwords(passwords: Iterable[str], workers: int = None,
+                   timeout: float = None) -> List[bytes]:
+    """
+    Hashes many passwords in parallel.
+
+    Args:
+        passwords (iterable): The plain-text passwords to hash.
+        workers (int): Number of threads, WORKERS by default.
+        timeout (float): Seconds to wait for each hash before raising
+            concurrent.futures.TimeoutError.
+
+    Returns:
+        list: The hashed passwords, in input order.
+    """
+    return _run_batch(hash_password, ((p,) for p in passwords),
+                      workers, timeout)
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]], workers: int = None,
+                timeout: float = None) -> List[bool]:
+    """
+    Verifies many (hashed_password, password) pairs in parallel.
+
+    Args:
+        pairs (iterable): Stored hashes with the passwords to check.
+        workers (int): Number of threads, WORKERS by default.
+        timeout (float): Seconds to wait for each check before raising
+            concurrent.futures.TimeoutError.
+
+    Returns:
+        list: is_valid of every pair, in input order.
+    """
+    return _run_batch(is_valid, pairs, workers, timeout)
+
+
+class AsyncHasher:
+    """ Runs bcrypt calls for coroutines on a dedicated thread pool. """
+
+    def __init__(self, workers: int = WORKERS):
+        """
+        Initializes the hasher and its executor.
+
+        Args:
+            workers (int): Maximum number of concurrent bcrypt calls.
+        """
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='bcrypt')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+
+    def _call(self, func: Callable, *args):
+        """
+        Runs func on an executor thread, keeping the counters current.
+        """
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    def _cancelled(self, future: Future) -> None:
+        """
+        Uncounts a call cancelled before it reached a thread.
+        """
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def _run(self, func: Callable, *args):
+        """
+        Awaits func(*args) without blocking the event loop.
+        """
+        with self._lock:
+            self._queued += 1
+        try:
+            future = self._executor.submit(self._call, func, *args)
+        except BaseException:
+            with self._lock:
+                self._queued -= 1
+            raise
+        future.add_done_callback(self._cancelled)
+        return await asyncio.wrap_future(future)
+
+    async def hash_password(self, password: str,
+                            rounds: int = None) -> bytes:
+        """
+        Coroutine version of hash_password.
+        """
+        return await self._run(hash_password, password, rounds)
+
+    async def is_valid(self, hashed_password: bytes, password: str) -> bool:
+        """
+        Coroutine version of is_valid.
+        """
+        return await self._run(is_valid, hashed_password, password)
+
+    def metrics(self) -> dict:
+        """
+        Returns the state of the executor queue.
+
+        Returns:
+            dict: Calls waiting for a thread, running and completed.
+        """
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queued': self._queued,
+                'running': self._running,
+                'completed': self._completed,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the executor once the submitted calls are done.
+
+        Args:
+            wait (bool): Block until the running calls have finished.
+        """
+        self._executor.shutdown(wait=wait)
+
+
+_async_hasher = None
+_async_lock = threading.Lock()
+
+
+def get_async_hasher() -> AsyncHasher:
+    """
+    Returns the shared AsyncHasher, creating it on first use.
+
+    Returns:
+        AsyncHasher: The shared hasher.
+    """
+    global _async_hasher
+    with _async_lock:
+        if _async_hasher is None:
+            _async_hasher = AsyncHasher()
+        return _async_hasher
+
+
+def configure_async(workers: int = WORKERS) -> AsyncHasher:
+    """
+    Replaces the shared AsyncHasher, shutting the previous one down.
+
+    Args:
+        workers (int): Maximum number of concurrent bcrypt calls.
+
+    Returns:
+        AsyncHasher: The new shared hasher.
+    """
+    global _async_hasher
+    with _async_lock:
+        if _async_hasher is not None:
+            _async_hasher.shutdown(wait=False)
+        _async_hasher = AsyncHasher(workers)
+        return _async_hasher
+
+
+def shutdown_async(wait: bool = True) -> None:
+    """
+    Shuts the shared AsyncHasher down, if it was ever created.
+
+    Args:
+        wait (bool): Block until the running calls have finished.
+    """
+    global _async_hasher
+    with _async_lock:
+        hasher, _async_hasher = _async_hasher, None
+    if hasher is not None:
+        hasher.shutdown(wait)
+
+
+atexit.register(shutdown_async)
+
+
+async def hash_password_async(password: str, rounds: int = None) -> bytes:
+    """
+    Hashes the password on the shared executor.
+
+    Args:
+        password (str): The plain-text password to hash.
+        rounds (int): bcrypt work factor, ROUNDS or bcrypt's default if
+            None.
+
+    Returns:
+        bytes: The hashed password.
+    """
+    return await get_async_hasher().hash_password(password, rounds)
+
+
+async def is_valid_async(hashed_password: bytes, password: str) -> bool:
+    """
+    Verifies the password on the shared executor.
+
+    Args:
+        hashed_password (bytes): The stored hashed password.
+        password (str): The plain-text password to verify.
+
+    Returns:
+        bool: True if the password matches, False otherwise.
+    """
+    return await get_async_hasher().is_valid(hashed_password, password)
@@ -2,16 +2,71 @@
 """
 Defines a function and classes for redacting PII in log messages.
 """
-from typing import List
+from typing import (BinaryIO, Callable, Dict, List, Mapping, Match,
+                    Optional, Pattern, Tuple, Union)
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import argparse
+import csv
+import io
+import mmap
 import re
+import atexit
+import bisect
 import logging
+import logging.handlers
 import os
-import mysql.connector
+import queue
+import sys
+import threading
+import time
+try:
+    import mysql.connector
+except ImportError:
+    mysql = None
 
 
 # Fields with personally identifiable information (PII)
 PII_FIELDS = ('name', 'email', 'phone', 'ssn', 'password')
 
+# Default capacity of the in-memory queue used by queued loggers
+QUEUE_SIZE = 10000
+
+# What a queued logger does when its queue is full
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_new')
+
+# Number of rows fetched per round trip when exporting users
+BATCH_SIZE = 1000
+
+# Connection pool defaults, overridable through the environment
+POOL_SIZE = 5
+POOL_MAX_LIFETIME = 3600
+POOL_TIMEOUT = 30
+
+# Target size in bytes of each chunk handed to a redaction worker
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Size in bytes of the reads performed by redact_stream
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Maximum number of compiled (fields, separator) patterns kept around
+PATTERN_CACHE_SIZE = 128
+
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def _redaction_pattern(fields: Tuple[str, ...], separator: str) -> Pattern:
+    """
+    Compiles a single alternation pattern matching any of the fields.
+
+    Args:
+        fields (tuple): Fields to match, in priority order.
+        separator (str): Separator between fields in the message.
+
+    Returns:
+        Pattern: The compiled pattern, cached per (fields, separator).
+    """
+    return re.compile('(' + '|'.join(fields) + ')=.*?' + separator)
+
 
 def filter_datum(fields: List[str], redaction: str,
                  message: str, separator: str) -> str:
@@ -27,10 +82,191 @@ def filter_datum(fields: List[str], redaction: str,
     Returns:
         str: The redacted message.
     """
-    for field in fields:
-        message = re.sub(field+'=.*?'+separator,
-                         field+'='+redaction+separator, message)
-    return message
+    if not fields:
+        return message
+    pattern = _redaction_pattern(tuple(fields), separator)
+    return pattern.sub('\\g<1>=' + redaction + separator, message)
+
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def _bytes_redaction_pattern(fields: Tuple[str, ...],
+                             separator: bytes) -> Pattern:
+    """
+    Compiles the bytes counterpart of _redaction_pattern.
+
+    Args:
+        fields (tuple): Fields to match, in priority order.
+        separator (bytes): Separator between fields in the message.
+
+    Returns:
+        Pattern: The compiled pattern, cached per (fields, separator).
+    """
+    alternation = b'|'.join(field.encode() for field in fields)
+    return re.compile(b'(' + alternation + b')=.*?' + separator)
+
+
+def filter_datum_bytes(fields: List[str], redaction: bytes,
+                       buffer: Union[bytes, bytearray, memoryview],
+                       separator: bytes) -> bytearray:
+    """
+    Obfuscates fields in a raw log buffer without decoding it.
+
+    The field spans are located first so the output is allocated once
+    and filled by copying slices of the input.
+
+    Args:
+        fields (list): Fields to obfuscate.
+        redaction (bytes): Bytes used to replace sensitive data.
+        buffer (bytes-like): The raw log data to redact.
+        separator (bytes): Separator between fields in the message.
+
+    Returns:
+        bytearray: The redacted data.
+    """
+    view = memoryview(buffer)
+    if not fields:
+        return bytearray(view)
+    pattern = _bytes_redaction_pattern(tuple(fields), separator)
+    spans = [(m.end(1) + 1, m.end()) for m in pattern.finditer(view)]
+
+    replacement = redaction + separator
+    size = len(view) + sum(len(replacement) - (end - start)
+                           for start, end in spans)
+    out = bytearray(size)
+    pos = out_pos = 0
+    for start, end in spans:
+        length = start - pos
+        out[out_pos:out_pos + length] = view[pos:start]
+        out_pos += length
+        out[out_pos:out_pos + len(replacement)] = replacement
+        out_pos += len(replacement)
+        pos = end
+    out[out_pos:] = view[pos:]
+    return out
+
+
+def redact_stream(src: BinaryIO, dst: BinaryIO,
+                  fields: List[str] = PII_FIELDS, redaction: bytes = b"***",
+                  separator: bytes = b";",
+                  chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+    """
+    Redacts a binary stream chunk by chunk.
+
+    Only complete lines are redacted; a record straddling two reads is
+    carried over and redacted once the rest of it has been read.
+
+    Args:
+        src (BinaryIO): Stream to read the raw logs from.
+        dst (BinaryIO): Stream to write the redacted logs to.
+        fields (list): Fields to obfuscate.
+        redaction (bytes): Bytes used to replace sensitive data.
+        separator (bytes): Separator between fields in the message.
+        chunk_size (int): Number of bytes read at once.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    pending = bytearray()
+    chunk = bytearray(chunk_size)
+    written = 0
+    while True:
+        read = src.readinto(chunk)
+        if not read:
+            break
+        pending += memoryview(chunk)[:read]
+        end = pending.rfind(b'\n') + 1
+        if end:
+            written += dst.write(filter_datum_bytes(
+                fields, redaction, memoryview(pending)[:end], separator))
+            del pending[:end]
+    if pending:
+        written += dst.write(
+            filter_datum_bytes(fields, redaction, pending, separator))
+    return written
+
+
+def redact_mapping(fields: List[str], redaction: str,
+                   data: Mapping) -> dict:
+    """
+    Obfuscates the values of a mapping whose keys are listed in fields.
+
+    Args:
+        fields (list): Keys to obfuscate.
+        redaction (str): String used to replace sensitive data.
+        data (Mapping): Structured log data.
+
+    Returns:
+        dict: A copy of data with the sensitive values replaced.
+    """
+    return {k: redaction if k in fields else v for k, v in data.items()}
+
+
+class RedactionMetrics:
+    """ Thread-safe counters describing the work of a RedactingFormatter. """
+
+    # Upper bounds in seconds of the formatting time histogram buckets
+    BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2)
+
+    def __init__(self):
+        """
+        Initializes every counter to zero.
+        """
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Sets every counter back to zero.
+        """
+        with self._lock:
+            self._records = 0
+            self._seconds = 0.0
+            self._bytes_in = 0
+            self._bytes_out = 0
+            self._redactions = {}
+            self._histogram = [0] * (len(self.BUCKETS) + 1)
+
+    def observe(self, seconds: float, bytes_in: int, bytes_out: int,
+                redactions: Dict[str, int]) -> None:
+        """
+        Records one formatted record.
+
+        Args:
+            seconds (float): Time spent formatting the record.
+            bytes_in (int): UTF-8 size of the message before redaction.
+            bytes_out (int): UTF-8 size of the redacted message.
+            redactions (dict): Number of redactions per field.
+        """
+        bucket = bisect.bisect_left(self.BUCKETS, seconds)
+        with self._lock:
+            self._records += 1
+            self._seconds += seconds
+            self._bytes_in += bytes_in
+            self._bytes_out += bytes_out
+            self._histogram[bucket] += 1
+            for field, count in redactions.items():
+                self._redactions[field] = \
+                    self._redactions.get(field, 0) + count
+
+    def snapshot(self) -> dict:
+        """
+        Returns a consistent copy of the counters.
+
+        Returns:
+            dict: Records formatted, cumulative seconds, bytes in and out,
+            redactions per field and the time histogram, keyed by the
+            upper bound of each bucket ('inf' for the last one).
+        """
+        with self._lock:
+            bounds = [str(b) for b in self.BUCKETS] + ['inf']
+            return {
+                'records': self._records,
+                'seconds': self._seconds,
+                'bytes_in': self._bytes_in,
+                'bytes_out': self._bytes_out,
+                'redactions': dict(self._redactions),
+                'histogram': dict(zip(bounds, self._histogram)),
+            }
 
 
 class RedactingFormatter(logging.Formatter):
@@ -39,38 +275,236 @@ class RedactingFormatter(logging.Formatter):
     REDACTION = "***"  # Redaction string
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"  # Separator for fields
+    DATA_ATTRIBUTE = "data"  # Record attribute holding structured data
 
-    def __init__(self, fields: List[str]):
+    def __init__(self, fields: List[str],
+                 metrics: RedactionMetrics = None):
         """
         Initializes RedactingFormatter with fields to redact.
 
         Args:
             fields (list): Fields to redact in the logs.
+            metrics (RedactionMetrics): Counters to update, if any.
         """
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.metrics = metrics
+        self._field_set = frozenset(fields)
+
+    def _structured(self, record: logging.LogRecord,
+                    counts: Dict[str, int] = None
+                    ) -> Optional[logging.LogRecord]:
+        """
+        Builds a redacted copy of a record carrying structured data.
+
+        Structured data is either a mapping passed as the logging argument
+        (logger.info("name=%(name)s", {...})) or a mapping given through
+        extra={'data': {...}}, rendered as key=value pairs after the
+        message. Sensitive values are replaced by key lookup.
+
+        Args:
+            record (logging.LogRecord): LogRecord instance.
+            counts (dict): Filled with the redactions per field, if given.
+
+        Returns:
+            logging.LogRecord: The redacted copy, or None when the record
+            holds no structured data.
+        """
+        data = getattr(record, self.DATA_ATTRIBUTE, None)
+        from_args = not isinstance(data, Mapping)
+        if from_args:
+            data = record.args
+            if not isinstance(data, Mapping):
+                return None
+
+        if counts is not None:
+            for k in data:
+                if k in self._field_set:
+                    counts[k] = counts.get(k, 0) + 1
+        data = redact_mapping(self._field_set, self.REDACTION, data)
+
+        copy = logging.makeLogRecord(record.__dict__)
+        if from_args:
+            copy.args = data
+        else:
+            pairs = "".join("{}={}{}".format(k, v, self.SEPARATOR)
+                            for k, v in data.items())
+            message = record.getMessage()
+            copy.msg = message + " " + pairs if message else pairs
+            copy.args = None
+        return copy
 
     def format(self, record: logging.LogRecord) -> str:
         """
         Formats and redacts the log message.
 
+        Structured data is first redacted by key, so that separators in
+        its values can't shift the redaction; the rendered message, which
+        may still hold PII in its text, arguments or exception, is then
+        always passed through filter_datum.
+
         Args:
             record (logging.LogRecord): LogRecord instance.
 
         Returns:
             str: The formatted log message with redacted fields.
         """
+        if self.metrics is not None:
+            return self._format_measured(record)
+        structured = self._structured(record)
+        if structured is not None:
+            record = structured
         message = super(RedactingFormatter, self).format(record)
         redacted = filter_datum(
           self.fields, self.REDACTION, message, self.SEPARATOR
         )
         return redacted
 
+    def _format_measured(self, record: logging.LogRecord) -> str:
+        """
+        Formats and redacts the log message, updating self.metrics.
+
+        The message is redacted in a single pass counting each field as
+        it goes. Sizes are in UTF-8 bytes; for structured records the size
+        before redaction is the size of the message redacted by key, the
+        values redacted that way being unknown to it, and they are not
+        counted twice.
+
+        Args:
+            record (logging.LogRecord): LogRecord instance.
+
+        Returns:
+            str: The formatted log message with redacted fields.
+        """
+        start = time.perf_counter()
+        counts = {}
+        structured = self._structured(record, counts)
+        if structured is not None:
+            record = structured
+        message = super(RedactingFormatter, self).format(record)
+        tail = "=" + self.REDACTION + self.SEPARATOR
+
+        def redact(match: Match) -> str:
+            """ Counts and redacts one field. """
+            field = match.group(1)
+            if structured is None or match.group(0) != field + tail:
+                counts[field] = counts.get(field, 0) + 1
+            return field + tail
+
+        redacted = message
+        if self.fields:
+            pattern = _redaction_pattern(tuple(self.fields), self.SEPARATOR)
+            redacted = pattern.sub(redact, message)
+        self.metrics.observe(time.perf_counter() - start,
+                             len(message.encode('utf-8', 'surrogatepass')),
+                             len(redacted.encode('utf-8', 'surrogatepass')),
+                             counts)
+        return redacted
+
+
+class RedactingQueueHandler(logging.handlers.QueueHandler):
+    """ Queue handler that defers formatting to a background listener. """
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = 'block'):
+        """
+        Initializes RedactingQueueHandler with a bounded queue.
+
+        Args:
+            log_queue (queue.Queue): Queue shared with the listener.
+            overflow (str): One of OVERFLOW_POLICIES.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of {}".format(
+                ', '.join(OVERFLOW_POLICIES)))
+        super(RedactingQueueHandler, self).__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+        self.listener = None
+        self._dropped_lock = threading.Lock()
+
+    def _drop(self) -> None:
+        """
+        Counts one dropped record; enqueue runs on every logging thread.
+        """
+        with self._dropped_lock:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Leaves the record untouched so redaction runs on the listener.
+
+        Args:
+            record (logging.LogRecord): LogRecord instance.
+
+        Returns:
+            logging.LogRecord: The same record.
+        """
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        Puts a record on the queue according to the overflow policy.
+
+        Args:
+            record (logging.LogRecord): LogRecord instance.
+        """
+        if self.overflow == 'block':
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                if self.overflow == 'drop_new':
+                    self._drop()
+                    return
+            try:
+                self.queue.get_nowait()
+                self._drop()
+            except queue.Empty:
+                pass
+
+
+class RedactingQueueListener(logging.handlers.QueueListener):
+    """ Queue listener that can always be stopped, even on a full queue. """
+
+    def enqueue_sentinel(self) -> None:
+        """
+        Waits for room on the queue before posting the stop sentinel.
+        """
+        self.queue.put(self._sentinel)
+
+
+def stop_logger(logger: logging.Logger) -> None:
+    """
+    Flushes and stops the background listeners of a queued logger.
+
+    Args:
+        logger (logging.Logger): Logger returned by get_logger.
+    """
+    for handler in logger.handlers:
+        listener = getattr(handler, 'listener', None)
+        if listener is not None and listener._thread is not None:
+            listener.stop()
 
-def get_logger() -> logging.Logger:
+
+def get_logger(queued: bool = False, queue_size: int = QUEUE_SIZE,
+               overflow: str = 'block',
+               metrics: RedactionMetrics = None) -> logging.Logger:
     """
     Returns a configured logger with redacting formatter.
 
+    A queued logger is only set up once: while its listener is running,
+    later queued calls return it as is and the other arguments are
+    ignored.
+
+    Args:
+        queued (bool): Format and write records on a background thread.
+        queue_size (int): Capacity of the queue when queued.
+        overflow (str): Policy applied when the queue is full.
+        metrics (RedactionMetrics): Counters updated by the formatter.
+
     Returns:
         logging.Logger: The configured logger.
     """
@@ -78,21 +512,195 @@ def get_logger() -> logging.Logger:
     logger.setLevel(logging.INFO)
     logger.propagate = False
 
+    existing = [h for h in logger.handlers
+                if isinstance(h, RedactingQueueHandler)]
+    if queued:
+        for queue_handler in existing:
+            listener = queue_handler.listener
+            if listener is not None and listener._thread is not None:
+                return logger
+            logger.removeHandler(queue_handler)
+
     handler = logging.StreamHandler()
-    formatter = RedactingFormatter(PII_FIELDS)
+    formatter = RedactingFormatter(PII_FIELDS, metrics)
     handler.setFormatter(formatter)
+
+    if queued:
+        queue_handler = RedactingQueueHandler(queue.Queue(queue_size),
+                                              overflow)
+        queue_handler.listener = RedactingQueueListener(
+            queue_handler.queue, handler)
+        queue_handler.listener.start()
+        if not existing:
+            atexit.register(stop_logger, logger)
+        handler = queue_handler
     logger.addHandler(handler)
 
     return logger
 
 
-def get_db() -> mysql.connector.connection.MySQLConnection:
+class PooledConnection:
+    """ Connection checked out of a ConnectionPool. """
+
+    def __init__(self, pool: 'ConnectionPool', conn, created_at: float):
+        """
+        Wraps a raw connection so that close() returns it to the pool.
+
+        Args:
+            pool (ConnectionPool): Pool the connection belongs to.
+            conn: The raw database connection.
+            created_at (float): Monotonic time the connection was opened.
+        """
+        self._pool = pool
+        self._conn = conn
+        self._created_at = created_at
+
+    def __getattr__(self, name: str):
+        """ Delegates everything else to the raw connection. """
+        return getattr(self._conn, name)
+
+    def __enter__(self) -> 'PooledConnection':
+        """ Supports use as a context manager. """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """ Returns the connection to the pool. """
+        self.close()
+
+    def close(self) -> None:
+        """
+        Returns the connection to the pool instead of closing it.
+        """
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn, self._created_at)
+
+    def __del__(self) -> None:
+        """ Returns a connection that was never closed to the pool. """
+        if self.__dict__.get('_conn') is not None:
+            self.close()
+
+
+class ConnectionPool:
+    """ Thread-safe pool of reusable database connections. """
+
+    def __init__(self, factory: Callable, size: int = POOL_SIZE,
+                 max_lifetime: float = POOL_MAX_LIFETIME):
+        """
+        Initializes an empty pool; connections are opened on demand.
+
+        Args:
+            factory (callable): Opens a new DB-API connection.
+            size (int): Maximum number of connections open at once.
+            max_lifetime (float): Seconds before a connection is recycled.
+        """
+        self.factory = factory
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @staticmethod
+    def _is_healthy(conn) -> bool:
+        """
+        Checks that a connection still answers a trivial query.
+        """
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(conn) -> None:
+        """
+        Closes a connection, ignoring errors from a dead link.
+        """
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self, timeout: float = None) -> PooledConnection:
+        """
+        Checks out a healthy connection, opening one if none is idle.
+
+        Args:
+            timeout (float): Seconds to wait for a free slot.
+
+        Returns:
+            PooledConnection: The checked out connection.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("no database connection available")
+        try:
+            while True:
+                try:
+                    conn, created_at = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                age = time.monotonic() - created_at
+                if age < self.max_lifetime and self._is_healthy(conn):
+                    return PooledConnection(self, conn, created_at)
+                self._discard(conn)
+            conn = self.factory()
+            return PooledConnection(self, conn, time.monotonic())
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, created_at: float) -> None:
+        """
+        Rolls back a connection and puts it back in the idle set.
+
+        A connection that fails to roll back is closed instead, so that
+        no open transaction or broken link is handed to the next caller.
+
+        Args:
+            conn: The raw database connection.
+            created_at (float): Monotonic time the connection was opened.
+        """
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+        else:
+            self._idle.put((conn, created_at))
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        """
+        Closes every idle connection.
+        """
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def connect_db() -> "mysql.connector.connection.MySQLConnection":
     """
-    Establishes a connection to the MySQL database.
+    Opens a new MySQL connection from the PERSONAL_DATA_DB_* variables.
 
     Returns:
         mysql.connector.connection.MySQLConnection: The database connection.
+
+    Raises:
+        ImportError: mysql-connector-python is not installed.
     """
+    if mysql is None:
+        raise ImportError("connect_db requires mysql-connector-python; "
+                          "install it or pass configure_pool a factory")
     user = os.getenv('PERSONAL_DATA_DB_USERNAME') or "root"
     passwd = os.getenv('PERSONAL_DATA_DB_PASSWORD') or ""
     host = os.getenv('PERSONAL_DATA_DB_HOST') or "localhost"
@@ -103,6 +711,206 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     return conn
 
 
+def _new_pool(factory: Callable, size: int,
+              max_lifetime: float) -> ConnectionPool:
+    """
+    Builds a pool, filling unset sizes from the environment.
+    """
+    if size is None:
+        size = int(os.getenv('PERSONAL_DATA_DB_POOL_SIZE') or POOL_SIZE)
+    if max_lifetime is None:
+        max_lifetime = float(os.getenv('PERSONAL_DATA_DB_POOL_MAX_LIFETIME')
+                             or POOL_MAX_LIFETIME)
+    return ConnectionPool(factory, size, max_lifetime)
+
+
+def configure_pool(factory: Callable = None, size: int = None,
+                   max_lifetime: float = None) -> ConnectionPool:
+    """
+    Replaces the pool used by get_db.
+
+    Sizes left as None come from PERSONAL_DATA_DB_POOL_SIZE and
+    PERSONAL_DATA_DB_POOL_MAX_LIFETIME, then from the module defaults.
+
+    Args:
+        factory (callable): Opens a new connection, connect_db by default.
+        size (int): Maximum number of connections open at once.
+        max_lifetime (float): Seconds before a connection is recycled.
+
+    Returns:
+        ConnectionPool: The new pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = _new_pool(factory or connect_db, size, max_lifetime)
+        return _pool
+
+
+def get_db(timeout: float = None) -> PooledConnection:
+    """
+    Checks out a connection to the MySQL database from the shared pool.
+
+    Args:
+        timeout (float): Seconds to wait for a free connection; defaults
+            to PERSONAL_DATA_DB_POOL_TIMEOUT, then POOL_TIMEOUT.
+
+    Returns:
+        PooledConnection: The database connection; close() returns it.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _new_pool(connect_db, None, None)
+        pool = _pool
+    if timeout is None:
+        timeout = float(os.getenv('PERSONAL_DATA_DB_POOL_TIMEOUT')
+                        or POOL_TIMEOUT)
+    return pool.acquire(timeout)
+
+
+def export_users(db, logger: logging.Logger,
+                 batch_size: int = BATCH_SIZE) -> int:
+    """
+    Streams every row of the users table to the logger.
+
+    Rows are pulled with fetchmany so memory stays flat regardless of the
+    table size. Any DB-API connection works; the column names come from
+    cursor.column_names when available and cursor.description otherwise.
+
+    Args:
+        db: Open database connection.
+        logger (logging.Logger): Logger receiving one line per row.
+        batch_size (int): Number of rows fetched per round trip.
+
+    Returns:
+        int: The number of rows exported.
+    """
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT * FROM users;")
+        fields = getattr(cursor, 'column_names', None)
+        if fields is None:
+            fields = [column[0] for column in cursor.description]
+        template = "".join("{}={{}}; ".format(k) for k in fields).strip()
+
+        count = 0
+        rows = cursor.fetchmany(batch_size)
+        while rows:
+            for row in rows:
+                logger.info(template.format(*row))
+            count += len(rows)
+            rows = cursor.fetchmany(batch_size)
+        return count
+    finally:
+        cursor.close()
+
+
+def _record_boundaries(mm: mmap.mmap, start: int,
+                       chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    Splits a CSV buffer into chunks that end on a record boundary.
+
+    A newline only ends a record when it sits outside a quoted field,
+    which is tracked through the parity of the quotes seen so far.
+
+    Args:
+        mm (mmap.mmap): Memory-mapped file.
+        start (int): Offset of the first record to split.
+        chunk_size (int): Target size of each chunk in bytes.
+
+    Returns:
+        list: (start, end) offsets of every chunk, in file order.
+    """
+    size = len(mm)
+    chunks = []
+    while start < size:
+        end = min(start + chunk_size, size)
+        quotes = mm[start:end].count(b'"')
+        while end < size:
+            newline = mm.find(b'\n', end)
+            if newline == -1:
+                end = size
+                break
+            quotes += mm[end:newline].count(b'"')
+            end = newline + 1
+            if quotes % 2 == 0:
+                break
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+
+def _redact_chunk(args: Tuple[str, int, int, Tuple[int, ...], str]) -> str:
+    """
+    Redacts the given columns of every record in one chunk of a CSV file.
+
+    Args:
+        args (tuple): File path, start and end offsets, indexes of the
+            columns to redact and the redaction string.
+
+    Returns:
+        str: The redacted records as CSV text.
+    """
+    file_path, start, end, columns, redaction = args
+    with open(file_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            text = mm[start:end].decode('utf-8')
+
+    out = io.StringIO()
+    writer = csv.writer(out, quoting=csv.QUOTE_ALL, lineterminator='\n')
+    for row in csv.reader(io.StringIO(text, newline='')):
+        for i in columns:
+            if i < len(row):
+                row[i] = redaction
+        writer.writerow(row)
+    return out.getvalue()
+
+
+def redact_file(src: str, dst: str, fields: List[str] = PII_FIELDS,
+                redaction: str = RedactingFormatter.REDACTION,
+                workers: int = None, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Redacts the PII columns of a CSV file on a pool of processes.
+
+    The header row names the columns; every column listed in fields is
+    replaced by the redaction string. Chunks are redacted in parallel and
+    written to dst in their original order.
+
+    Args:
+        src (str): Path of the CSV file to redact.
+        dst (str): Path of the redacted CSV file to write.
+        fields (list): Columns to obfuscate.
+        redaction (str): String used to replace sensitive data.
+        workers (int): Number of processes, one per CPU by default.
+        chunk_size (int): Target size of each chunk in bytes.
+
+    Returns:
+        int: The number of chunks processed.
+    """
+    with open(src, 'rb') as f, open(dst, 'w', newline='') as out:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header_end = _record_boundaries(mm, 0, 1)[0][1]
+            header_line = mm[:header_end].decode('utf-8')
+            chunks = _record_boundaries(mm, header_end, chunk_size)
+
+        header = next(csv.reader(io.StringIO(header_line, newline='')))
+        columns = tuple(i for i, k in enumerate(header) if k in fields)
+        writer = csv.writer(out, quoting=csv.QUOTE_MINIMAL,
+                            lineterminator='\n')
+        writer.writerow(header)
+
+        jobs = [(src, start, end, columns, redaction)
+                for start, end in chunks]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for text in executor.map(_redact_chunk, jobs):
+                out.write(text)
+    return len(chunks)
+
+
 def main():
     """
     Main function to fetch and log user data with redaction.
@@ -110,17 +918,34 @@ def main():
     db = get_db()
     logger = get_logger()
 
-    cursor = db.cursor()
-    cursor.execute("SELECT * FROM users;")
-    fields = cursor.column_names
+    export_users(db, logger)
+    db.close()
 
-    for row in cursor:
-        message = "".join("{}={}; ".format(k, v) for k, v in zip(fields, row))
-        logger.info(message.strip())
 
-    cursor.close()
-    db.close()
+def redact_main(argv: List[str]) -> None:
+    """
+    Command line entry point redacting a CSV file in parallel.
+
+    Args:
+        argv (list): Command line arguments, without the program name.
+    """
+    parser = argparse.ArgumentParser(
+        description="Redact the PII columns of a CSV file.")
+    parser.add_argument('src', help="CSV file to redact")
+    parser.add_argument('dst', help="where to write the redacted file")
+    parser.add_argument('-f', '--fields', nargs='+', default=PII_FIELDS,
+                        help="columns to redact")
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help="number of worker processes")
+    parser.add_argument('-c', '--chunk-size', type=int, default=CHUNK_SIZE,
+                        help="target chunk size in bytes")
+    args = parser.parse_args(argv)
+    redact_file(args.src, args.dst, args.fields,
+                workers=args.workers, chunk_size=args.chunk_size)
 
 
 if __name__ == "__main__":
-    main()  # Run the main function
+    if len(sys.argv) > 1:
+        redact_main(sys.argv[1:])
+    else:
+        main()  # Run the main function
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Compares serial and thread-pool password hashing from encrypt_password.
+"""
+from typing import List
+import argparse
+import sys
+import time
+
+import encrypt_password
+from encrypt_password import (hash_password, hash_passwords, target_rounds,
+                              WORKERS)
+
+
+def main(argv: List[str]) -> None:
+    """
+    Times hash_passwords against a serial loop for growing worker counts.
+
+    Args:
+        argv (list): Command line arguments, without the program name.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-n', '--passwords', type=int, default=32)
+    parser.add_argument('-w', '--max-workers', type=int,
+                        default=WORKERS * 2)
+    parser.add_argument('-r', '--rounds', type=int, default=None,
+                        help="work factor, encrypt_password's by default")
+    args = parser.parse_args(argv)
+    passwords = ['password{}'.format(i) for i in range(args.passwords)]
+
+    # Pin the work factor so every run hashes at the same cost, and hash
+    # once before timing anything
+    encrypt_password.ROUNDS = args.rounds or target_rounds()
+    hash_password('warmup')
+    print("rounds: {}".format(encrypt_password.ROUNDS))
+
+    start = time.perf_counter()
+    for password in passwords:
+        hash_password(password)
+    serial = time.perf_counter() - start
+    print("{:<10}{:>12}{:>10}".format('workers', 'seconds', 'speedup'))
+    print("{:<10}{:>12.2f}{:>10.2f}".format('serial', serial, 1.0))
+
+    workers = 1
+    while workers <= args.max_workers:
+        start = time.perf_counter()
+        hash_passwords(passwords, workers)
+        elapsed = time.perf_counter() - start
+        print("{:<10}{:>12.2f}{:>10.2f}".format(workers, elapsed,
+                                                serial / elapsed))
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Unit tests of filtered_logger.
+"""
+import gc
+import io
+import logging
+import logging.handlers
+import queue
+import sqlite3
+import threading
+import unittest
+from unittest import mock
+
+import filtered_logger
+from filtered_logger import (ConnectionPool, PII_FIELDS, RedactingFormatter,
+                             RedactingQueueHandler, RedactionMetrics,
+                             export_users, get_logger, stop_logger)
+
+
+class TestStructuredRedaction(unittest.TestCase):
+    """ Structured records must still have their text redacted. """
+
+    def setUp(self):
+        """
+        Builds a logger writing through a RedactingFormatter to a buffer.
+        """
+        self.stream = io.StringIO()
+        handler = logging.StreamHandler(self.stream)
+        handler.setFormatter(RedactingFormatter(PII_FIELDS))
+        self.logger = logging.Logger("test_filtered_logger")
+        self.logger.addHandler(handler)
+
+    def output(self) -> str:
+        """
+        Returns what was logged so far.
+        """
+        return self.stream.getvalue()
+
+    def test_extra_data_and_message_text(self):
+        """ PII in the message text is redacted next to extra data. """
+        self.logger.warning("name=bob;email=b@c;",
+                            extra={'data': {'ip': '1', 'ssn': '123'}})
+        out = self.output()
+        self.assertIn("name=***;email=***; ip=1;ssn=***;", out)
+        self.assertNotIn("bob", out)
+        self.assertNotIn("b@c", out)
+        self.assertNotIn("123", out)
+
+    def test_mapping_argument_values(self):
+        """ PII rendered from a mapping argument's values is redacted. """
+        self.logger.warning("%(msg)s", {'msg': 'name=bob;email=b@c;'})
+        out = self.output()
+        self.assertIn("name=***;email=***;", out)
+        self.assertNotIn("bob", out)
+
+    def test_mapping_argument_keys(self):
+        """ Values of sensitive keys are redacted, separators included. """
+        self.logger.warning("password=%(password)s;ip=%(ip)s;",
+                            {'password': 'a;b', 'ip': '1'})
+        self.assertIn("password=***;ip=1;", self.output())
+
+    def test_exception_text(self):
+        """ PII in the traceback of a structured record is redacted. """
+        try:
+            raise ValueError("email=b@c;")
+        except ValueError:
+            self.logger.exception("failed", extra={'data': {'ip': '1'}})
+        out = self.output()
+        self.assertIn("email=***;", out)
+        self.assertNotIn("b@c", out)
+
+    def test_metrics_count_each_redaction_once(self):
+        """ Fields redacted by key are not counted again by the regex. """
+        metrics = RedactionMetrics()
+        formatter = RedactingFormatter(PII_FIELDS, metrics)
+        record = logging.makeLogRecord({
+            'msg': "name=bob;", 'data': {'email': 'b@c'}})
+        out = formatter.format(record)
+        self.assertNotIn("bob", out)
+        self.assertEqual(metrics.snapshot()['redactions'],
+                         {'name': 1, 'email': 1})
+
+    def test_metrics_count_bytes(self):
+        """ Sizes are UTF-8 bytes and match the plain formatter output. """
+        metrics = RedactionMetrics()
+        formatter = RedactingFormatter(PII_FIELDS, metrics)
+        record = logging.makeLogRecord({'msg': "name=Zoë;city=Malmö;"})
+        out = formatter.format(record)
+        self.assertEqual(out, RedactingFormatter(PII_FIELDS).format(record))
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['bytes_out'], len(out.encode()))
+        self.assertEqual(snapshot['bytes_in'] - snapshot['bytes_out'],
+                         len("Zoë".encode()) - len("***"))
+        self.assertEqual(snapshot['redactions'], {'name': 1})
+
+
+class TestQueuedLogger(unittest.TestCase):
+    """ The queued pipeline is set up once and counts every drop. """
+
+    def tearDown(self):
+        """
+        Stops the listeners and detaches the handlers of user_data.
+        """
+        logger = logging.getLogger("user_data")
+        stop_logger(logger)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+
+    def queue_handlers(self, logger: logging.Logger) -> list:
+        """
+        Returns the queue handlers attached to logger.
+        """
+        return [h for h in logger.handlers
+                if isinstance(h, RedactingQueueHandler)]
+
+    def test_get_logger_is_idempotent(self):
+        """ A second queued call adds no handler, listener or hook. """
+        with mock.patch("filtered_logger.atexit.register") as register:
+            logger = get_logger(queued=True)
+            handlers = list(logger.handlers)
+            self.assertIs(get_logger(queued=True), logger)
+        self.assertEqual(logger.handlers, handlers)
+        self.assertEqual(len(self.queue_handlers(logger)), 1)
+        self.assertEqual(register.call_count, 1)
+
+    def test_stopped_listener_is_replaced(self):
+        """ A stopped pipeline is swapped for a running one. """
+        with mock.patch("filtered_logger.atexit.register") as register:
+            logger = get_logger(queued=True)
+            stop_logger(logger)
+            get_logger(queued=True)
+        queued = self.queue_handlers(logger)
+        self.assertEqual(len(queued), 1)
+        self.assertIsNotNone(queued[0].listener._thread)
+        self.assertEqual(register.call_count, 1)
+
+    def test_dropped_counter_is_exact(self):
+        """ Drops from concurrent threads are all counted. """
+        handler = RedactingQueueHandler(queue.Queue(1), 'drop_new')
+        record = logging.makeLogRecord({'msg': "name=bob;"})
+
+        def log():
+            """ Enqueues many records on a full queue. """
+            for _ in range(2000):
+                handler.enqueue(record)
+
+        threads = [threading.Thread(target=log) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(handler.dropped, 8 * 2000 - 1)
+
+
+class TestExportUsers(unittest.TestCase):
+    """ export_users logs one redacted record per row. """
+
+    def setUp(self):
+        """
+        Fills an in-memory SQLite users table and a logger to a buffer.
+        """
+        self.db = sqlite3.connect(":memory:")
+        self.db.execute("CREATE TABLE users (name TEXT, email TEXT, ip TEXT)")
+        self.db.executemany("INSERT INTO users VALUES (?, ?, ?)",
+                            [("user{}".format(i), "u{}@x.io".format(i),
+                              "10.0.0.{}".format(i)) for i in range(5)])
+        self.stream = io.StringIO()
+        handler = logging.StreamHandler(self.stream)
+        handler.setFormatter(RedactingFormatter(PII_FIELDS))
+        self.logger = logging.Logger("test_export_users")
+        self.logger.addHandler(handler)
+        self.records = logging.handlers.BufferingHandler(capacity=100)
+        self.logger.addHandler(self.records)
+
+    def tearDown(self):
+        """
+        Closes the database.
+        """
+        self.db.close()
+
+    def test_one_record_per_row(self):
+        """ Every row is its own record, across fetchmany batches. """
+        self.assertEqual(export_users(self.db, self.logger, batch_size=2), 5)
+        messages = [record.getMessage() for record in self.records.buffer]
+        self.assertEqual(len(messages), 5)
+        self.assertEqual(messages[1],
+                         "name=user1; email=u1@x.io; ip=10.0.0.1;")
+
+    def test_every_row_is_redacted(self):
+        """ Every row gets the log prefix and has its PII redacted. """
+        export_users(self.db, self.logger, batch_size=2)
+        out = self.stream.getvalue()
+        lines = out.splitlines()
+        self.assertEqual(len(lines), 5)
+        for line in lines:
+            self.assertTrue(line.startswith("[HOLBERTON] test_export_users"))
+            self.assertIn("name=***; email=***;", line)
+        self.assertNotRegex(out, r"user\d")
+        self.assertNotIn("@x.io", out)
+        self.assertIn("ip=10.0.0.4;", out)
+
+
+class TestConnectionPool(unittest.TestCase):
+    """ Connections go back to the pool clean, and slots are not lost. """
+
+    def setUp(self):
+        """
+        Builds a one-connection pool over a shared in-memory SQLite database.
+        """
+        self.opened = []
+        self.pool = ConnectionPool(self.connect, size=1)
+
+    def tearDown(self):
+        """
+        Closes the idle connections.
+        """
+        self.pool.close()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Opens a connection to the shared database.
+        """
+        conn = sqlite3.connect("file:pool?mode=memory&cache=shared",
+                               uri=True)
+        self.opened.append(conn)
+        return conn
+
+    def test_release_rolls_back(self):
+        """ An uncommitted transaction is not handed to the next caller. """
+        with self.pool.acquire() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS users (name TEXT)")
+            db.commit()
+            db.execute("INSERT INTO users VALUES ('bob')")
+        with self.pool.acquire() as db:
+            self.assertFalse(db.in_transaction)
+            count = db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        self.assertEqual(count, 0)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_failed_rollback_discards(self):
+        """ A connection that can't roll back is closed, not reused. """
+        db = self.pool.acquire()
+        self.opened[0].close()
+        db.close()
+        self.assertTrue(self.pool._idle.empty())
+        with self.pool.acquire(timeout=0):
+            pass
+        self.assertEqual(len(self.opened), 2)
+
+    def test_leaked_connection_frees_its_slot(self):
+        """ A connection dropped without close() returns its slot. """
+        db = self.pool.acquire(timeout=0)
+        del db
+        gc.collect()
+        with self.pool.acquire(timeout=0):
+            pass
+
+    def test_missing_driver(self):
+        """ connect_db says which package is missing. """
+        with mock.patch.object(filtered_logger, "mysql", None):
+            with self.assertRaisesRegex(ImportError, "mysql-connector"):
+                filtered_logger.connect_db()
+
+    def test_acquire_times_out(self):
+        """ Waiting for a slot gives up after the timeout. """
+        with self.pool.acquire():
+            with self.assertRaises(TimeoutError):
+                self.pool.acquire(timeout=0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
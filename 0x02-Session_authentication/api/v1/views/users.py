@@ -9,11 +9,31 @@ from models.user import User
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """GET /api/v1/users
+    Query parameters (optional):
+      - limit: maximum number of users to return.
+      - cursor: value of X-Next-Cursor from the previous page.
     Return:
-      - list of all User objects JSON represented.
+      - list of all User objects JSON represented, or of one page of
+        them ordered by creation date when limit or cursor is given;
+        the X-Next-Cursor header is then set unless it is the last page.
+      - 400 if limit or cursor is invalid.
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        all_users = [user.to_json() for user in User.all()]
+        return jsonify(all_users)
+    try:
+        limit = int(limit) if limit is not None else 100
+        if limit <= 0:
+            raise ValueError("invalid limit")
+        users, next_cursor = User.page({}, limit, cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    res = jsonify([user.to_json() for user in users])
+    if next_cursor is not None:
+        res.headers['X-Next-Cursor'] = next_cursor
+    return res
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
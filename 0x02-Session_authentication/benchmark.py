@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""Benchmarks of the model store.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import List
+
+import models.base as base
+from models.query import IEq, In, Prefix
+from models.user import User
+from models.user_session import UserSession
+
+
+def populate(count: int):
+    """Fill the User store with count synthetic users, in memory only when
+    the backend keeps them in DATA, saved one by one otherwise.
+    """
+    for file_name in os.listdir('.'):
+        os.remove(file_name)
+    User.load_from_file()
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First{}".format(i % 1000),
+                    last_name="Last{}".format(i % 5000))
+        user.password = "pwd{}".format(i)
+        if base.BACKEND.local:
+            User._store(user)
+        else:
+            user.save()
+
+
+def bench_startup(sizes: List[int]):
+    """Compare load_from_file with JSON and binary snapshots.
+    """
+    print("{:>10}{:>10}{:>12}{:>12}".format('objects', 'format',
+                                            'load (s)', 'size (MB)'))
+    for count in sizes:
+        for fmt in ('json', 'binary'):
+            base.SNAPSHOT_FORMAT = fmt
+            populate(count)
+            User.save_to_file()
+            size = os.path.getsize(User._snapshot_path())
+            start = time.perf_counter()
+            User.load_from_file()
+            elapsed = time.perf_counter() - start
+            print("{:>10}{:>10}{:>12.3f}{:>12.2f}".format(
+                count, fmt, elapsed, size / 1e6))
+
+
+def measure_memory(count: int) -> dict:
+    """Return the bytes allocated per User and per UserSession, each
+    user owning two sessions loaded from file.
+    """
+    for file_name in os.listdir('.'):
+        os.remove(file_name)
+    users = {}
+    sessions = {}
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i))
+        user.password = "pwd{}".format(i)
+        users[user.id] = user.to_json(True)
+        for j in range(2):
+            session = UserSession(user_id=user.id,
+                                  session_id="{}-{}".format(i, j))
+            sessions[session.id] = session.to_json(True)
+    for name, objs in (('User', users), ('UserSession', sessions)):
+        with open(".db_{}.json".format(name), 'w') as f:
+            json.dump(objs, f)
+
+    result = {'compact': base.COMPACT}
+    for cls, total in ((User, count), (UserSession, 2 * count)):
+        tracemalloc.start()
+        cls.load_from_file()
+        store = base.DATA[cls.__name__]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        result[cls.__name__] = size / total
+        del store
+    return result
+
+
+def bench_memory(count: int):
+    """Compare bytes per object with and without MODELS_COMPACT.
+    """
+    print("{:>10}{:>14}{:>14}".format('compact', 'User', 'UserSession'))
+    for compact in ('0', '1'):
+        env = dict(os.environ, MODELS_COMPACT=compact,
+                   PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+        out = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), 'memory',
+             '--child', str(count)], env=env)
+        result = json.loads(out)
+        print("{:>10}{:>14.0f}{:>14.0f}".format(
+            str(result['compact']), result['User'], result['UserSession']))
+
+
+def bench_stress(readers: int, writers: int, seconds: float,
+                 count: int) -> int:
+    """Measure read throughput of get/search/count while other threads
+    save and remove users, and report any error raised meanwhile.
+    """
+    populate(count)
+    ids = [user.id for user in User.all()]
+    errors = []
+
+    def run(stop: threading.Event, work, done: list):
+        n = 0
+        try:
+            while not stop.is_set():
+                work(n)
+                n += 1
+        except Exception as e:
+            errors.append(e)
+        done.append(n)
+
+    def read(n: int):
+        i = n % len(ids)
+        User.get(ids[i])
+        User.search({'email': "user{}@example.com".format(i)})
+        User.count()
+
+    def write(n: int):
+        user = User(email="new{}@example.com".format(n))
+        user.save()
+        user.remove()
+
+    print("{:>10}{:>10}{:>14}{:>14}".format('readers', 'writers',
+                                            'reads/s', 'writes/s'))
+    for n_writers in (0, writers):
+        stop = threading.Event()
+        reads = []
+        writes = []
+        threads = [threading.Thread(target=run, args=(stop, read, reads))
+                   for _ in range(readers)]
+        threads += [threading.Thread(target=run, args=(stop, write, writes))
+                    for _ in range(n_writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        print("{:>10}{:>10}{:>14.0f}{:>14.0f}".format(
+            readers, n_writers, sum(reads) / seconds,
+            sum(writes) / seconds))
+
+    if User.count() != count:
+        errors.append("expected {} users, found {}".format(
+            count, User.count()))
+    for error in errors:
+        print("error: {!r}".format(error), file=sys.stderr)
+    return 1 if errors else 0
+
+
+def bench_backends(count: int, ops: int):
+    """Compare the storage backends, rewriting the JSON snapshot or
+    appending to the journal for the JSON one: operations per second
+    with count users stored.
+    """
+    names = ('save', 'get', 'search', 'scan', 'count', 'page')
+    print("{:>10}".format('backend') +
+          "".join("{:>12}".format(name) for name in names))
+
+    def rate(work, n: int) -> float:
+        start = time.perf_counter()
+        for i in range(n):
+            work(i)
+        return n / (time.perf_counter() - start)
+
+    for name, backend, storage in (('json', 'json', 'json'),
+                                   ('journal', 'json', 'journal'),
+                                   ('sqlite', 'sqlite', 'json')):
+        for file_name in os.listdir('.'):
+            os.remove(file_name)
+        base.STORAGE = storage
+        base.BACKEND = base.BACKENDS[backend]()
+        User.load_from_file()
+        users = [User(email="user{}@example.com".format(i),
+                      first_name="First{}".format(i % 100))
+                 for i in range(count)]
+        ids = [user.id for user in users]
+
+        def page(i: int):
+            cursor = None
+            while True:
+                cursor = User.page({}, 100, cursor)[1]
+                if cursor is None:
+                    return
+
+        rates = [
+            rate(lambda i: users[i].save(), count),
+            rate(lambda i: User.get(ids[i % count]), ops),
+            rate(lambda i: User.search(
+                {'email': "user{}@example.com".format(i % count)}), ops),
+            rate(lambda i: User.search(
+                {'first_name': "First{}".format(i % 100)}), ops // 10),
+            rate(lambda i: User.count(), ops),
+            rate(page, max(1, ops // 1000)),
+        ]
+        base.flush()
+        print("{:>10}".format(name) +
+              "".join("{:>12.0f}".format(r) for r in rates))
+
+
+def bench_columnar(count: int, rounds: int):
+    """Compare the scan throughput of search, in objects per second,
+    between per-object matching and the columnar mirror.
+    """
+    populate(count)
+    queries = (
+        ('equal', {'first_name': "First7"}),
+        ('in', {'first_name': In(["First1", "First2", "First3"])}),
+        ('prefix', {'last_name': Prefix("Last12")}),
+        ('ieq', {'first_name': IEq("FIRST7"), 'last_name': "Last7"}),
+    )
+    print("{:>10}{:>16}{:>16}{:>10}".format('query', 'objects/s',
+                                            'columnar/s', 'speedup'))
+    start = time.perf_counter()
+    base.COLUMNAR = True
+    User.search({name: None for name in ('first_name', 'last_name')})
+    print("{:>10}{:>16}".format('build', "{:.3f} s".format(
+        time.perf_counter() - start)))
+    for name, query in queries:
+        rates = []
+        for columnar in (False, True):
+            base.COLUMNAR = columnar
+            start = time.perf_counter()
+            for _ in range(rounds):
+                found = User.search(query)
+            rates.append(count * rounds / (time.perf_counter() - start))
+            if columnar and found != expected:
+                raise AssertionError("columnar search of {} differs"
+                                     .format(name))
+            expected = found
+        print("{:>10}{:>16.0f}{:>16.0f}{:>9.1f}x".format(
+            name, rates[0], rates[1], rates[1] / rates[0]))
+
+
+def main(argv: List[str]):
+    """Command line entry point, run inside a temporary directory so the
+    real .db_* files are never touched.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    commands = parser.add_subparsers(dest='command')
+    startup = commands.add_parser('startup', help=bench_startup.__doc__)
+    startup.add_argument('sizes', type=int, nargs='*',
+                         default=[10000, 100000, 1000000])
+    memory = commands.add_parser('memory', help=bench_memory.__doc__)
+    memory.add_argument('count', type=int, nargs='?', default=100000)
+    memory.add_argument('--child', action='store_true',
+                        help=argparse.SUPPRESS)
+    stress = commands.add_parser('stress', help=bench_stress.__doc__)
+    stress.add_argument('-r', '--readers', type=int, default=4)
+    stress.add_argument('-w', '--writers', type=int, default=2)
+    stress.add_argument('-s', '--seconds', type=float, default=2.0)
+    stress.add_argument('-n', '--count', type=int, default=1000)
+    backends = commands.add_parser('backends', help=bench_backends.__doc__)
+    backends.add_argument('-n', '--count', type=int, default=1000)
+    backends.add_argument('-o', '--ops', type=int, default=10000)
+    columnar = commands.add_parser('columnar', help=bench_columnar.__doc__)
+    columnar.add_argument('-n', '--count', type=int, default=100000)
+    columnar.add_argument('-r', '--rounds', type=int, default=10)
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return
+    if args.command in ('startup', 'memory', 'columnar') and \
+            not base.BACKEND.local:
+        parser.error("{} measures objects held in DATA, which MODELS_BACKEND"
+                     "={} doesn't use".format(args.command, base.BACKEND_NAME))
+
+    status = 0
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        if args.command == 'startup':
+            bench_startup(args.sizes)
+        elif args.command == 'memory' and args.child:
+            print(json.dumps(measure_memory(args.count)))
+        elif args.command == 'memory':
+            bench_memory(args.count)
+        elif args.command == 'backends':
+            bench_backends(args.count, args.ops)
+        elif args.command == 'columnar':
+            bench_columnar(args.count, args.rounds)
+        elif args.command == 'stress':
+            status = bench_stress(args.readers, args.writers,
+                                  args.seconds, args.count)
+        base.flush()
+        os.chdir(cwd)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
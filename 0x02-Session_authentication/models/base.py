@@ -1,20 +1,125 @@
 #!/usr/bin/env python3
 """Base module.
 """
+import atexit
+import base64
 import json
+import logging
+import os
+import sys
+import threading
+import time
 import uuid
-from os import path
-from datetime import datetime
-from typing import TypeVar, List, Iterable
+from contextlib import nullcontext
+from itertools import count
+from os import getenv, path
+from datetime import datetime, timedelta
+from typing import TypeVar, List, Iterable, Iterator, Optional, Tuple
+
+from models import snapshot
+from models.columnar import ColumnStore
+from models.index import HashIndex, SortedIndex
+from models.lazy import LazyStore
+from models.query import In, Operator, Prefix, Range, matches
+from models.rwlock import FileLock, RWLock
+from models.storage import Backend, SQLiteBackend
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# Storage backend of the models: 'json' or 'sqlite' (see models.storage)
+BACKEND_NAME = getenv('MODELS_BACKEND', 'json')
+# 'json' rewrites .db_<Class>.json on every change, 'journal' appends
+# each change to .db_<Class>.journal and compacts it into the snapshot
+STORAGE = getenv('MODELS_STORAGE', 'json')
+JOURNAL_COMPACT_THRESHOLD = int(getenv('MODELS_JOURNAL_COMPACT_THRESHOLD',
+                                       '1000'))
+JOURNAL_COMPACT_INTERVAL = float(getenv('MODELS_JOURNAL_COMPACT_INTERVAL',
+                                        '0'))
+# With a positive MODELS_FLUSH_INTERVAL, changes are only marked dirty
+# and written by a background thread every interval, or as soon as
+# MODELS_FLUSH_THRESHOLD changes are pending
+FLUSH_INTERVAL = float(getenv('MODELS_FLUSH_INTERVAL', '0'))
+FLUSH_THRESHOLD = int(getenv('MODELS_FLUSH_THRESHOLD', '100'))
+# With a positive MODELS_RELOAD_INTERVAL, reads check at most once per
+# interval whether other processes changed the .db_<Class> files, and
+# apply their changes to DATA
+RELOAD_INTERVAL = float(getenv('MODELS_RELOAD_INTERVAL', '0'))
+# Format of the .db_<Class> snapshots: 'json' or 'binary' (see snapshot)
+SNAPSHOT_FORMAT = getenv('MODELS_SNAPSHOT_FORMAT', 'json')
+# With MODELS_LAZY_LOAD=1, load_from_file keeps the serialized records and
+# objects are only built when get, search or all reach them
+LAZY_LOAD = getenv('MODELS_LAZY_LOAD', '0') == '1'
+# With MODELS_COMPACT=1, models use __slots__, keep timestamps as epoch
+# microseconds and intern repeated strings (read once, at import time)
+COMPACT = getenv('MODELS_COMPACT', '0') == '1'
+EPOCH = datetime(1970, 1, 1)
+# With MODELS_COLUMNAR=1, searches that no index answers are evaluated
+# on a columnar mirror of the objects (see models.columnar)
+COLUMNAR = getenv('MODELS_COLUMNAR', '0') == '1'
+# Attribute ordering paginated scans, ties being broken by ID
+ORDER_BY = 'created_at'
+# Number of keys read under the lock at each step of a paginated scan
+SCAN_BATCH = 256
 DATA = {}
+JOURNALS = {}
+DIRTY = {}
+INDEXES = {}
+ORDERS = {}
+COLUMNS = {}
+LOCKS = {}
+SEQUENCE = {}
+# Versions of the files last read or written by this process, by class
+FILES = {}
+_sequence = count()
+_flush_lock = threading.Lock()
+_write_lock = threading.Lock()
+_flush_wakeup = threading.Event()
+_flusher = None
+logger = logging.getLogger(__name__)
+
+
+def timestamp_property(slot: str) -> property:
+    """Return a property exposing as a datetime the epoch microseconds
+    stored in slot.
+    """
+    def getter(self) -> datetime:
+        return EPOCH + timedelta(microseconds=getattr(self, slot))
+
+    def setter(self, value: datetime):
+        setattr(self, slot, (value - EPOCH) // timedelta(microseconds=1))
+
+    return property(getter, setter)
+
+
+def interned_property(slot: str) -> property:
+    """Return a property storing interned strings in slot.
+    """
+    def getter(self) -> str:
+        return getattr(self, slot)
+
+    def setter(self, value: str):
+        if type(value) is str:
+            value = sys.intern(value)
+        setattr(self, slot, value)
+
+    return property(getter, setter)
 
 
 class Base():
     """Base class.
     """
+    # Attributes with a hash index, used by search for equality lookups
+    INDEXED = ()
+    # Attributes with a sorted index, used by range_search
+    SORTED = ()
+    # Attributes serialized by to_json in COMPACT mode, in order
+    FIELDS = ('id', 'created_at', 'updated_at')
+
+    if COMPACT:
+        __slots__ = ('_id', '_created_at_us', '_updated_at_us')
+        id = interned_property('_id')
+        created_at = timestamp_property('_created_at_us')
+        updated_at = timestamp_property('_updated_at_us')
 
     def __init__(self, *args: list, **kwargs: dict):
         """Initialize a Base instance.
@@ -24,16 +129,19 @@ class Base():
             DATA[s_class] = {}
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
-        if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
-        else:
-            self.created_at = datetime.utcnow()
-        if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
-        else:
-            self.updated_at = datetime.utcnow()
+        self.created_at = self._timestamp(kwargs.get('created_at'))
+        self.updated_at = self._timestamp(kwargs.get('updated_at'))
+
+    @staticmethod
+    def _timestamp(value) -> datetime:
+        """Parse a timestamp given as a string or a datetime, defaulting
+        to now.
+        """
+        if value is None:
+            return datetime.utcnow()
+        if type(value) is datetime:
+            return value
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """Equality.
@@ -48,7 +156,14 @@ class Base():
         """Convert the object a JSON dictionary.
         """
         result = {}
-        for key, value in self.__dict__.items():
+        if COMPACT:
+            fields = []
+            for cls in reversed(type(self).__mro__):
+                fields.extend(cls.__dict__.get('FIELDS', ()))
+            items = ((key, getattr(self, key)) for key in fields)
+        else:
+            items = self.__dict__.items()
+        for key, value in items:
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -57,56 +172,475 @@ class Base():
                 result[key] = value
         return result
 
+    @classmethod
+    def _indexes(cls) -> dict:
+        """Return the hash indexes of the class, by attribute.
+        """
+        s_class = cls.__name__
+        if INDEXES.get(s_class) is None:
+            INDEXES[s_class] = {attr: HashIndex(attr) for attr in cls.INDEXED}
+        return INDEXES[s_class]
+
+    @classmethod
+    def _sorted_indexes(cls) -> dict:
+        """Return the sorted indexes of the class, by attribute: one on
+        ORDER_BY and one on each attribute of SORTED.
+        """
+        s_class = cls.__name__
+        if ORDERS.get(s_class) is None:
+            attrs = (ORDER_BY,) + tuple(a for a in cls.SORTED
+                                        if a != ORDER_BY)
+            ORDERS[s_class] = {attr: SortedIndex(attr) for attr in attrs}
+        return ORDERS[s_class]
+
+    @classmethod
+    def _order(cls) -> SortedIndex:
+        """Return the index ordering the objects of the class by ORDER_BY.
+        """
+        return cls._sorted_indexes()[ORDER_BY]
+
+    @classmethod
+    def _column_store(cls) -> ColumnStore:
+        """Return the columnar mirror of the objects of the class,
+        creating it on first use.
+        """
+        s_class = cls.__name__
+        columns = COLUMNS.get(s_class)
+        if columns is None:
+            columns = COLUMNS.setdefault(s_class, ColumnStore(DATA[s_class]))
+        return columns
+
+    @classmethod
+    def _lock(cls) -> RWLock:
+        """Return the reader/writer lock guarding the objects of the class.
+        """
+        s_class = cls.__name__
+        lock = LOCKS.get(s_class)
+        if lock is None:
+            lock = LOCKS.setdefault(s_class, RWLock())
+        return lock
+
+    @classmethod
+    def _io_lock(cls) -> threading.Lock:
+        """Return the lock serializing the snapshot writes of the class.
+        """
+        s_class = "{}.io".format(cls.__name__)
+        lock = LOCKS.get(s_class)
+        if lock is None:
+            lock = LOCKS.setdefault(s_class, threading.Lock())
+        return lock
+
+    @classmethod
+    def _file_lock(cls) -> FileLock:
+        """Return the lock serializing, across processes, the changes to
+        the files of the class; it is taken before the reader/writer lock.
+        """
+        s_class = "{}.file".format(cls.__name__)
+        lock = LOCKS.get(s_class)
+        if lock is None:
+            lock = LOCKS.setdefault(s_class, FileLock(
+                ".db_{}.lock".format(cls.__name__)))
+        return lock
+
+    @classmethod
+    def _store(cls, obj: TypeVar('Base')):
+        """Put an object in DATA and keep the indexes in sync.
+        """
+        s_class = cls.__name__
+        if obj.id not in DATA[s_class]:
+            SEQUENCE.setdefault(s_class, {})[obj.id] = next(_sequence)
+        DATA[s_class][obj.id] = obj
+        for index in cls._indexes().values():
+            index.add(obj)
+        for index in cls._sorted_indexes().values():
+            index.add(obj)
+        if s_class in COLUMNS:
+            COLUMNS[s_class].add(obj)
+
+    @classmethod
+    def _store_record(cls, record: dict):
+        """Put a serialized object loaded from file in DATA, keeping it
+        serialized when LAZY_LOAD is set.
+        """
+        if not LAZY_LOAD:
+            cls._store(cls(**record))
+            return
+        s_class = cls.__name__
+        obj_id = record.get('id')
+        if obj_id not in DATA[s_class]:
+            SEQUENCE.setdefault(s_class, {})[obj_id] = next(_sequence)
+        DATA[s_class].set_record(obj_id, record)
+        for attr, index in cls._indexes().items():
+            index.add_value(obj_id, record.get(attr))
+        for attr, index in cls._sorted_indexes().items():
+            index.add_value(obj_id, record.get(attr))
+        if s_class in COLUMNS:
+            COLUMNS[s_class].add(DATA[s_class][obj_id])
+
+    @classmethod
+    def _unstore(cls, obj_id: str):
+        """Remove an object from DATA and from the indexes.
+        """
+        s_class = cls.__name__
+        del DATA[s_class][obj_id]
+        del SEQUENCE[s_class][obj_id]
+        for index in cls._indexes().values():
+            index.discard(obj_id)
+        for index in cls._sorted_indexes().values():
+            index.discard(obj_id)
+        if s_class in COLUMNS:
+            COLUMNS[s_class].discard(obj_id)
+
+    @classmethod
+    def _snapshot_path(cls) -> str:
+        """Return the path of the snapshot file in SNAPSHOT_FORMAT.
+        """
+        if SNAPSHOT_FORMAT == 'binary':
+            return ".db_{}.bin".format(cls.__name__)
+        return ".db_{}.json".format(cls.__name__)
+
     @classmethod
     def load_from_file(cls):
-        """Load all objects from file.
+        """Load all objects from file, replaying the journal if any.
+        """
+        BACKEND.load(cls)
+
+    @classmethod
+    def _load(cls):
+        """Body of load_from_file for the objects held in DATA. Changes
+        still pending are written first, so that they are read back.
+        """
+        with _write_lock:
+            with cls._file_lock().holding():
+                with cls._lock().writing():
+                    _flush_class(cls)
+                    cls._read_files()
+
+    @classmethod
+    def _read_files(cls):
+        """Replace the objects of the class by those of its files.
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
+        DATA[s_class] = LazyStore(cls) if LAZY_LOAD else {}
+        SEQUENCE[s_class] = {}
+        COLUMNS.pop(s_class, None)
+        for index in cls._indexes().values():
+            index.clear()
+        for index in cls._sorted_indexes().values():
+            index.clear()
+
+        versions = cls._file_versions()
+        for obj_json in cls._read_snapshot():
+            cls._store_record(obj_json)
+        entries, offset = cls._read_journal(0)
+        for entry in entries:
+            if entry['op'] == 'upsert':
+                cls._store_record(entry['obj'])
+            elif entry['id'] in DATA[s_class]:
+                cls._unstore(entry['id'])
+        JOURNALS[s_class] = {'entries': len(entries),
+                             'compacted_at': time.time()}
+        FILES[s_class] = {'snapshot': versions, 'journal': offset,
+                          'checked': time.monotonic()}
+
+    @classmethod
+    def _read_snapshot(cls) -> Iterable[dict]:
+        """Return the objects of the snapshot file, serialized.
+        """
+        file_path = cls._snapshot_path()
+        if SNAPSHOT_FORMAT == 'binary' and path.exists(file_path):
+            return snapshot.read(file_path)
+        file_path = ".db_{}.json".format(cls.__name__)
         if not path.exists(file_path):
+            return []
+        with open(file_path, 'r') as f:
+            return json.load(f).values()
+
+    @classmethod
+    def _read_journal(cls, offset: int) -> Tuple[List[dict], int]:
+        """Return the journal entries following offset, and the offset
+        of their end. A torn write ends the journal.
+        """
+        journal_path = ".db_{}.journal".format(cls.__name__)
+        entries = []
+        if not path.exists(journal_path):
+            return entries, 0
+        with open(journal_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                entries.append(entry)
+                offset += len(line)
+        return entries, offset
+
+    @classmethod
+    def _file_versions(cls) -> tuple:
+        """Return the (inode, mtime, size) of the snapshot files, None
+        for the missing ones.
+        """
+        versions = []
+        for file_path in (cls._snapshot_path(),
+                          ".db_{}.json".format(cls.__name__)):
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                versions.append(None)
+                continue
+            versions.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        return tuple(versions)
+
+    @classmethod
+    def _journal_size(cls) -> int:
+        """Return the size of the journal file, 0 when missing.
+        """
+        try:
+            return os.path.getsize(".db_{}.journal".format(cls.__name__))
+        except OSError:
+            return 0
+
+    @classmethod
+    def refresh(cls):
+        """Apply the changes other processes wrote to the files of the
+        class since this one last read them: only the new journal
+        entries when the snapshot is unchanged, otherwise the objects
+        which differ from the snapshot and journal.
+
+        Objects with changes pending in this process are left as is.
+        """
+        s_class = cls.__name__
+        files = FILES.get(s_class)
+        if files is None:
+            return
+        if cls._file_versions() == files['snapshot'] and \
+                cls._journal_size() == files['journal']:
             return
+        with _write_lock:
+            with cls._file_lock().holding():
+                with cls._lock().writing():
+                    cls._merge_files(cls._pending())
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def _pending(cls, written: Iterable[str] = ()) -> set:
+        """Return the IDs of the objects whose changes in DATA are not
+        on file yet, including written, the ones being written.
+        """
+        with _flush_lock:
+            pending = {e['id'] for e in DIRTY.get(cls, ())}
+        pending.update(written)
+        return pending
+
+    @classmethod
+    def _merge_files(cls, pending: set):
+        """Apply the changes found in the files since they were last read,
+        except to pending objects; run under the write and file locks.
+        """
+        s_class = cls.__name__
+        files = FILES.get(s_class)
+        if files is None:
+            return
+        versions = cls._file_versions()
+        size = cls._journal_size()
+        if versions == files['snapshot'] and size > files['journal']:
+            entries, files['journal'] = cls._read_journal(files['journal'])
+            JOURNALS[s_class]['entries'] += len(entries)
+        elif versions != files['snapshot'] or size != files['journal']:
+            entries = cls._reread(pending)
+            files['snapshot'] = versions
+        else:
+            return
+        for entry in entries:
+            cls._apply(entry, pending)
+
+    @classmethod
+    def _reread(cls, pending: set) -> List[dict]:
+        """Read the snapshot and journal again, remove the objects they
+        no longer hold and return an upsert entry per object they hold.
+        """
+        s_class = cls.__name__
+        records = {}
+        for record in cls._read_snapshot():
+            records[record['id']] = record
+        entries, FILES[s_class]['journal'] = cls._read_journal(0)
+        for entry in entries:
+            if entry['op'] == 'upsert':
+                records[entry['id']] = entry['obj']
+            else:
+                records.pop(entry['id'], None)
+        JOURNALS[s_class]['entries'] = len(entries)
+
+        for obj_id in list(DATA[s_class].keys()):
+            if obj_id not in records and obj_id not in pending:
+                cls._unstore(obj_id)
+        return [{'op': 'upsert', 'id': obj_id, 'obj': record}
+                for obj_id, record in records.items()]
+
+    @classmethod
+    def _apply(cls, entry: dict, pending: set):
+        """Apply a change read from file unless the object is pending or
+        already in this state.
+        """
+        s_class = cls.__name__
+        obj_id = entry['id']
+        if obj_id in pending:
+            return
+        if entry['op'] != 'upsert':
+            if obj_id in DATA[s_class]:
+                cls._unstore(obj_id)
+            return
+        store = DATA[s_class]
+        if isinstance(store, LazyStore):
+            current = store.serialized(obj_id)
+        else:
+            current = store.get(obj_id)
+            if current is not None:
+                current = current.to_json(True)
+        if current != snapshot.serialize_record(entry['obj']):
+            cls._store_record(entry['obj'])
 
     @classmethod
     def save_to_file(cls):
         """Save all objects to file.
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        file_path = cls._snapshot_path()
+        with cls._io_lock():
+            objs_json = {}
+            with cls._lock().reading():
+                store = DATA[s_class]
+                if isinstance(store, LazyStore):
+                    objs_json.update(store.serialized_items())
+                else:
+                    for obj_id, obj in store.items():
+                        objs_json[obj_id] = obj.to_json(True)
+
+            tmp_path = "{}.tmp".format(file_path)
+            if SNAPSHOT_FORMAT == 'binary':
+                with open(tmp_path, 'wb') as f:
+                    f.write(snapshot.encode(objs_json))
+            else:
+                with open(tmp_path, 'w') as f:
+                    json.dump(objs_json, f)
+            os.replace(tmp_path, file_path)
+            if s_class in FILES:
+                FILES[s_class]['snapshot'] = cls._file_versions()
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def _rewrite(cls, written: Iterable[str] = ()):
+        """Rewrite the snapshot with all objects, once the changes other
+        processes wrote meanwhile are merged in DATA. written are the IDs
+        of the changes being written besides the pending ones.
+
+        Only the merge takes the write lock: the objects are serialized
+        under the read lock and written out under the file lock alone.
+        """
+        with cls._file_lock().holding():
+            with cls._lock().writing():
+                cls._merge_files(cls._pending(written))
+            cls.save_to_file()
+
+    @classmethod
+    def compact(cls):
+        """Write a snapshot of all objects, including the changes other
+        processes wrote meanwhile, and empty the journal.
+        """
+        s_class = cls.__name__
+        with cls._file_lock().holding():
+            cls._rewrite()
+            open(".db_{}.journal".format(s_class), 'w').close()
+            JOURNALS[s_class] = {'entries': 0, 'compacted_at': time.time()}
+            if s_class in FILES:
+                FILES[s_class]['journal'] = 0
+
+    @classmethod
+    def append_to_journal(cls, entries: List[dict]):
+        """Append changes to the journal in a single write, compacting
+        it once it is large or old enough.
+
+        The journal offset read so far moves past the written entries
+        when nothing else was appended since, so that refresh doesn't
+        apply them again.
+        """
+        s_class = cls.__name__
+        lines = "".join(json.dumps(entry) + "\n" for entry in entries)
+        with cls._file_lock().holding():
+            with open(".db_{}.journal".format(s_class), 'ab') as f:
+                start = f.tell()
+                f.write(lines.encode())
+                end = f.tell()
+            files = FILES.get(s_class)
+            if files is not None and files['journal'] == start:
+                files['journal'] = end
+
+        journal = JOURNALS.setdefault(
+            s_class, {'entries': 0, 'compacted_at': time.time()})
+        journal['entries'] += len(entries)
+        age = time.time() - journal['compacted_at']
+        if journal['entries'] >= JOURNAL_COMPACT_THRESHOLD or \
+                (JOURNAL_COMPACT_INTERVAL > 0 and
+                 age >= JOURNAL_COMPACT_INTERVAL):
+            cls.compact()
+
+    @classmethod
+    def write_changes(cls, entries: List[dict]):
+        """Write changes to disk according to STORAGE.
+        """
+        if STORAGE == 'journal':
+            cls.append_to_journal(entries)
+        else:
+            cls._rewrite(entry['id'] for entry in entries)
+
+    @classmethod
+    def _writing_through(cls):
+        """Return the context of a save or remove: the file lock when
+        changes are written at once, so that they reach the files in the
+        order they were made in DATA.
+        """
+        if FLUSH_INTERVAL > 0:
+            return nullcontext()
+        return cls._file_lock().holding()
+
+    @classmethod
+    def persist(cls, op: str, obj: TypeVar('Base')) -> List[dict]:
+        """Record one change ('upsert' or 'delete') under the write lock,
+        leaving it to the background flusher when FLUSH_INTERVAL is set.
+
+        Return the entries to write with write_changes once the write
+        lock is released, none when the flusher writes them.
+        """
+        entry = {'op': op, 'id': obj.id}
+        if op == 'upsert' and STORAGE == 'journal':
+            entry['obj'] = obj.to_json(True)
+        if FLUSH_INTERVAL <= 0:
+            return [entry]
+
+        with _flush_lock:
+            DIRTY.setdefault(cls, []).append(entry)
+            pending = sum(len(entries) for entries in DIRTY.values())
+        _start_flusher()
+        if pending >= FLUSH_THRESHOLD:
+            _flush_wakeup.set()
+        return []
 
     def save(self):
         """Save current object.
         """
-        s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        BACKEND.save(self)
 
     def remove(self):
         """Remove object.
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        BACKEND.remove(self)
 
     @classmethod
     def count(cls) -> int:
         """Count all objects.
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return BACKEND.count(cls)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -118,20 +652,423 @@ class Base():
     def get(cls, id: str) -> TypeVar('Base'):
         """Return one object by ID.
         """
+        return BACKEND.get(cls, id)
+
+    @classmethod
+    def _index_lookup(cls, attr: str, value) -> Optional[tuple]:
+        """Return (index kind, IDs) of the objects which may satisfy one
+        predicate according to an index, or None when no index applies.
+        """
+        hash_index = cls._indexes().get(attr)
+        sorted_index = cls._sorted_indexes().get(attr)
+        try:
+            if hash_index is not None and not isinstance(value, Operator):
+                ids = hash_index.lookup(value)
+                if ids is not None:
+                    return 'hash', ids
+            if hash_index is not None and isinstance(value, In):
+                ids = {}
+                for v in value.values:
+                    found = hash_index.lookup(v)
+                    if found is None:
+                        break
+                    ids.update(dict.fromkeys(found))
+                else:
+                    return 'hash', ids.keys()
+            if sorted_index is None:
+                return None
+            if isinstance(value, Range):
+                return 'sorted', sorted_index.range(value.start, value.end)
+            if isinstance(value, Prefix):
+                return 'sorted', sorted_index.prefix(value.prefix)
+            if value is not None and not isinstance(value, Operator):
+                return 'sorted', sorted_index.equal(value)
+        except TypeError:
+            pass
+        return None
+
+    @classmethod
+    def _plan(cls, attributes: dict) -> Tuple[Optional[list], dict]:
+        """Choose how to evaluate a search.
+
+        Every predicate that an index can answer yields a candidate set;
+        the sets are intersected from the most selective one on. Without
+        any, the columnar mirror answers the search exactly when COLUMNAR
+        is set. Return the candidates in DATA order, or None when a full
+        scan is needed, along with a description of the plan.
+        """
         s_class = cls.__name__
-        return DATA[s_class].get(id)
+        steps = []
+        for k, v in attributes.items():
+            found = cls._index_lookup(k, v)
+            if found is not None:
+                steps.append({'attribute': k, 'index': found[0],
+                              'operator': repr(v), 'ids': found[1]})
+        if len(steps) == 0 and COLUMNAR and len(attributes) > 0:
+            ids, distinct = cls._column_store().select(attributes)
+            if ids is not None:
+                store = DATA[s_class]
+                steps = [{'attribute': k, 'operator': repr(v),
+                          'distinct': distinct.get(k)}
+                         for k, v in attributes.items()]
+                return [store[obj_id] for obj_id in ids], \
+                    {'plan': 'columnar', 'steps': steps}
+        if len(steps) == 0:
+            return None, {'plan': 'scan', 'steps': []}
+
+        steps.sort(key=lambda step: len(step['ids']))
+        ids = None
+        for step in steps:
+            step['candidates'] = len(step['ids'])
+            ids = set(step.pop('ids')) if ids is None \
+                else ids.intersection(step.pop('ids'))
+        store = DATA[s_class]
+        objs = [store[obj_id] for obj_id in ids]
+        if len(objs) > 1:
+            sequence = SEQUENCE[s_class]
+            objs.sort(key=lambda obj: sequence[obj.id])
+        return objs, {'plan': 'index', 'steps': steps}
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """Search all objects with matching attributes.
+
+        Values are compared for equality unless they are operators from
+        models.query (In, Prefix, IEq, Range).
+        """
+        return BACKEND.search(cls, attributes)
+
+    @classmethod
+    def explain(cls, attributes: dict = {}) -> dict:
+        """Run a search and describe how it was evaluated: the plan
+        ('index', 'columnar' or 'scan' in DATA), the indexes used with their
+        candidate counts, and the number of objects examined and matched.
+        """
+        return BACKEND.explain(cls, attributes)
+
+    @staticmethod
+    def encode_cursor(key: Tuple[datetime, str]) -> str:
+        """Turn the (ORDER_BY value, ID) key of an object into an opaque
+        pagination cursor.
+        """
+        value, obj_id = key
+        if type(value) is datetime:
+            value = value.isoformat()
+        token = json.dumps([value, obj_id]).encode()
+        return base64.urlsafe_b64encode(token).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+        """Turn a pagination cursor back into a key; raise ValueError
+        when it is malformed.
+        """
+        try:
+            value, obj_id = json.loads(base64.urlsafe_b64decode(cursor))
+        except Exception:
+            raise ValueError("invalid cursor")
+        return SortedIndex.normalize(value), obj_id
+
+    @classmethod
+    def _key(cls, obj: TypeVar('Base')) -> Tuple[datetime, str]:
+        """Return the ordering key of an object.
+        """
+        return SortedIndex.normalize(getattr(obj, ORDER_BY)), obj.id
+
+    @classmethod
+    def iter_search(cls, attributes: dict = {}, limit: int = None,
+                    offset: int = 0, cursor: str = None
+                    ) -> Iterator[TypeVar('Base')]:
+        """Yield the objects with matching attributes ordered by
+        (ORDER_BY, id), skipping offset of them and stopping after limit.
+        With a cursor, start right after the object it designates.
+
+        The lock is only held while reading a batch of SCAN_BATCH keys,
+        never while the caller consumes the objects.
+        """
+        key = None if cursor is None else cls.decode_cursor(cursor)
+        if limit is not None and limit <= 0:
+            return
+
+        objs = BACKEND.candidates(cls, attributes)
+        if objs is not None:
+            objs = sorted(objs, key=cls._key)
+            if key is not None:
+                objs = [obj for obj in objs if cls._key(obj) > key]
+            batches = iter([objs])
+        else:
+            batches = cls._scan(key)
+
+        for batch in batches:
+            for obj in batch:
+                if not matches(obj, attributes):
+                    continue
+                if offset > 0:
+                    offset -= 1
+                    continue
+                yield obj
+                if limit is not None:
+                    limit -= 1
+                    if limit == 0:
+                        return
+
+    @classmethod
+    def _scan(cls, key: Optional[Tuple[datetime, str]]
+              ) -> Iterator[List[TypeVar('Base')]]:
+        """Yield every object following key in (ORDER_BY, id) order,
+        SCAN_BATCH objects at a time.
         """
+        while True:
+            objs = BACKEND.scan(cls, key, SCAN_BATCH)
+            if len(objs) == 0:
+                return
+            key = cls._key(objs[-1])
+            yield objs
+
+    @classmethod
+    def iter_all(cls, limit: int = None, offset: int = 0,
+                 cursor: str = None) -> Iterator[TypeVar('Base')]:
+        """Yield all objects in pages, see iter_search.
+        """
+        return cls.iter_search({}, limit, offset, cursor)
+
+    @classmethod
+    def range_search(cls, attr: str, start: datetime = None,
+                     end: datetime = None) -> List[TypeVar('Base')]:
+        """Return the objects whose attr is in [start, end), ordered by
+        (attr, id); a missing bound leaves that side open.
+
+        Attributes with a sorted index (ORDER_BY and SORTED) are answered
+        in O(log N + k); others fall back to a full scan.
+        """
+        s_class = cls.__name__
+        start = SortedIndex.normalize(start)
+        end = SortedIndex.normalize(end)
+        if not BACKEND.local:
+            objs = cls.search({attr: Range(start, end)})
+            return sorted(objs, key=lambda obj: (
+                SortedIndex.normalize(getattr(obj, attr)), obj.id))
+        with cls._lock().reading():
+            index = cls._sorted_indexes().get(attr)
+            store = DATA[s_class]
+            if index is not None:
+                return [store[obj_id] for obj_id in index.range(start, end)]
+            objs = []
+            for obj in store.values():
+                value = SortedIndex.normalize(getattr(obj, attr))
+                if value is None:
+                    continue
+                if (start is None or value >= start) and \
+                        (end is None or value < end):
+                    objs.append(obj)
+        return sorted(objs, key=lambda obj: (
+            SortedIndex.normalize(getattr(obj, attr)), obj.id))
+
+    @classmethod
+    def page(cls, attributes: dict = {}, limit: int = 100,
+             cursor: str = None
+             ) -> Tuple[List[TypeVar('Base')], Optional[str]]:
+        """Return one page of matching objects and the cursor of the next
+        page, None when this page is the last one.
+        """
+        objs = list(cls.iter_search(attributes, limit + 1, 0, cursor))
+        if len(objs) <= limit:
+            return objs, None
+        objs = objs[:limit]
+        return objs, cls.encode_cursor(cls._key(objs[-1]))
+
+
+class JSONBackend(Backend):
+    """Objects held in DATA, with the indexes and locks of Base, and
+    persisted to .db_<Class> files according to STORAGE.
+    """
+    local = True
+
+    @staticmethod
+    def _refresh(cls: type):
+        """Refresh the objects of cls from file if RELOAD_INTERVAL elapsed
+        since the last check.
+        """
+        if RELOAD_INTERVAL <= 0:
+            return
+        files = FILES.get(cls.__name__)
+        now = time.monotonic()
+        if files is None or now - files['checked'] < RELOAD_INTERVAL:
+            return
+        files['checked'] = now
+        cls.refresh()
+
+    def load(self, cls: type):
+        """Load all objects of cls from file.
+        """
+        cls._load()
+
+    def count(self, cls: type) -> int:
+        """Count the objects of cls in DATA.
+        """
+        self._refresh(cls)
+        s_class = cls.__name__
+        with cls._lock().reading():
+            return len(DATA[s_class])
+
+    def get(self, cls: type, obj_id: str) -> Base:
+        """Return the object of cls with this ID, or None.
+        """
+        self._refresh(cls)
+        s_class = cls.__name__
+        with cls._lock().reading():
+            return DATA[s_class].get(obj_id)
+
+    def search(self, cls: type, attributes: dict) -> List[Base]:
+        """Return the objects of cls with matching attributes, using the
+        indexes chosen by Base._plan.
+        """
+        self._refresh(cls)
         s_class = cls.__name__
         def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-
-        return list(filter(_search, DATA[s_class].values()))
+            return matches(obj, attributes)
+
+        with cls._lock().reading():
+            objs, plan = cls._plan(attributes)
+            if plan['plan'] == 'columnar':
+                return objs
+            if objs is None:
+                objs = DATA[s_class].values()
+            return list(filter(_search, objs))
+
+    def save(self, obj: Base):
+        """Store an object and persist the change.
+        """
+        cls = obj.__class__
+        with cls._writing_through():
+            with cls._lock().writing():
+                obj.updated_at = datetime.utcnow()
+                cls._store(obj)
+                entries = cls.persist('upsert', obj)
+            if entries:
+                cls.write_changes(entries)
+
+    def remove(self, obj: Base):
+        """Remove an object and persist the change.
+        """
+        cls = obj.__class__
+        s_class = cls.__name__
+        with cls._writing_through():
+            with cls._lock().writing():
+                if DATA[s_class].get(obj.id) is None:
+                    return
+                cls._unstore(obj.id)
+                entries = cls.persist('delete', obj)
+            if entries:
+                cls.write_changes(entries)
+
+    def candidates(self, cls: type, attributes: dict) -> Optional[List[Base]]:
+        """Return the candidates of the plan of a search, if indexed.
+        """
+        self._refresh(cls)
+        with cls._lock().reading():
+            return cls._plan(attributes)[0]
+
+    def scan(self, cls: type, key: Optional[Tuple[datetime, str]],
+             size: int) -> List[Base]:
+        """Return at most size objects following key in the ORDER_BY
+        index, read under the lock.
+        """
+        self._refresh(cls)
+        s_class = cls.__name__
+        with cls._lock().reading():
+            keys = cls._order().keys_after(key, size)
+            store = DATA[s_class]
+            return [store[obj_id] for _, obj_id in keys]
+
+    def explain(self, cls: type, attributes: dict) -> dict:
+        """Run a search and describe its plan, see Base._plan.
+        """
+        self._refresh(cls)
+        s_class = cls.__name__
+        with cls._lock().reading():
+            objs, plan = cls._plan(attributes)
+            if objs is None:
+                objs = DATA[s_class].values()
+            matched = sum(1 for obj in objs if matches(obj, attributes))
+            plan['examined'] = len(objs)
+            plan['matched'] = matched
+        return plan
+
+
+BACKENDS = {'json': JSONBackend, 'sqlite': SQLiteBackend}
+if BACKEND_NAME not in BACKENDS:
+    raise ValueError("unknown MODELS_BACKEND: {}".format(BACKEND_NAME))
+BACKEND = BACKENDS[BACKEND_NAME]()
+
+
+def _flush_class(cls: type):
+    """Write the pending changes of cls; when that fails, put them back
+    in DIRTY ahead of the newer ones so that the next flush retries them.
+    """
+    with _flush_lock:
+        entries = DIRTY.pop(cls, [])
+    if not entries:
+        return
+    try:
+        cls.write_changes(entries)
+    except Exception:
+        with _flush_lock:
+            DIRTY[cls] = entries + DIRTY.get(cls, [])
+        raise
+
+
+def flush():
+    """Write every pending change of every class, raising the first
+    error once every class was tried.
+    """
+    error = None
+    with _write_lock:
+        with _flush_lock:
+            classes = list(DIRTY.keys())
+        for cls in classes:
+            try:
+                _flush_class(cls)
+            except Exception as e:
+                error = error or e
+    if error is not None:
+        raise error
+
+
+def sync():
+    """Flush pending changes and force the written files to disk.
+    """
+    with _flush_lock:
+        classes = list(DIRTY.keys())
+    flush()
+    for cls in classes:
+        for ext in ('json', 'bin', 'journal'):
+            file_path = ".db_{}.{}".format(cls.__name__, ext)
+            if path.exists(file_path):
+                with open(file_path, 'a') as f:
+                    os.fsync(f.fileno())
+
+
+def _flush_loop():
+    """Body of the background flusher thread.
+    """
+    while True:
+        _flush_wakeup.wait(FLUSH_INTERVAL)
+        _flush_wakeup.clear()
+        try:
+            flush()
+        except Exception:
+            logger.exception("flushing the model store failed, will retry")
+
+
+def _start_flusher():
+    """Start the background flusher thread once.
+    """
+    global _flusher
+    with _flush_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, daemon=True,
+                                        name='models-flusher')
+            _flusher.start()
+
+
+atexit.register(flush)
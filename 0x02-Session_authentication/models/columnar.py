@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Columnar mirror module.
+
+A ColumnStore keeps, for the objects of one class, one dictionary-encoded
+column per searched attribute: the distinct values are stored once and
+every object only holds the integer code of its value. A search predicate
+is evaluated once per distinct value, then turned into a mask over the
+codes: with NumPy when it is installed, otherwise with map and compress,
+which also run over the codes without a Python-level loop.
+"""
+import operator
+import threading
+from array import array
+from itertools import compress
+from typing import Any, List, Mapping, Tuple
+
+from models.query import Operator
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Removed rows are only marked dead, and swept once they are more than
+# this many and half of the rows
+COMPACT_MIN_DEAD = 1024
+
+
+class Column():
+    """Dictionary-encoded values of one attribute, by row.
+    """
+
+    def __init__(self, attribute: str):
+        """Initialize an empty column of attribute.
+        """
+        self.attribute = attribute
+        self.values = []
+        self.codes = array('l')
+        self._codes_of = {}
+
+    def encode(self, value: Any) -> int:
+        """Return the code of value, adding it to the dictionary if new.
+        """
+        try:
+            code = self._codes_of.get(value)
+        except TypeError:
+            code = None
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            try:
+                self._codes_of[value] = code
+            except TypeError:
+                pass
+        return code
+
+    def set(self, row: int, value: Any):
+        """Set the value of a row, appending it if row is the next one.
+        """
+        code = self.encode(value)
+        if row == len(self.codes):
+            self.codes.append(code)
+        else:
+            self.codes[row] = code
+
+    def matching_codes(self, expected: Any) -> List[int]:
+        """Return the codes of the values matching a search value, an
+        operator of models.query or a value to compare for equality.
+        """
+        if isinstance(expected, Operator):
+            return [code for code, value in enumerate(self.values)
+                    if expected.matches(value)]
+        if len(self._codes_of) == len(self.values):
+            try:
+                code = self._codes_of.get(expected)
+            except TypeError:
+                pass
+            else:
+                if code is None or self.values[code] != expected:
+                    return []
+                return [code]
+        return [code for code, value in enumerate(self.values)
+                if not (value != expected)]
+
+
+class ColumnStore():
+    """Columnar mirror of the objects of one class, kept in insertion
+    order. Columns are built on the first search of their attribute, and
+    then updated on every add and discard.
+    """
+
+    def __init__(self, store: Mapping[str, Any]):
+        """Initialize the mirror of the objects of store, a DATA entry,
+        without any column yet.
+        """
+        self._store = store
+        self._ids = list(store.keys())
+        self._rows = {obj_id: row for row, obj_id in enumerate(self._ids)}
+        self._live = bytearray(b"\x01" * len(self._ids))
+        self._dead = 0
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of live rows.
+        """
+        return len(self._rows)
+
+    def add(self, obj: Any):
+        """Add an object, or update its row if already present.
+        """
+        row = self._rows.get(obj.id)
+        if row is None:
+            row = len(self._ids)
+            self._ids.append(obj.id)
+            self._live.append(1)
+            self._rows[obj.id] = row
+        for attr, column in list(self._columns.items()):
+            try:
+                column.set(row, getattr(obj, attr))
+            except AttributeError:
+                del self._columns[attr]
+
+    def discard(self, obj_id: str):
+        """Remove an object, if present.
+        """
+        row = self._rows.pop(obj_id, None)
+        if row is None:
+            return
+        self._live[row] = 0
+        self._dead += 1
+        if self._dead > COMPACT_MIN_DEAD and self._dead * 2 > len(self._ids):
+            self._sweep()
+
+    def _sweep(self):
+        """Drop the dead rows and the values only they used.
+        """
+        rows = [row for row, live in enumerate(self._live) if live]
+        self._ids = [self._ids[row] for row in rows]
+        self._rows = {obj_id: row for row, obj_id in enumerate(self._ids)}
+        self._live = bytearray(b"\x01" * len(rows))
+        self._dead = 0
+        for attr, column in list(self._columns.items()):
+            swept = Column(attr)
+            for new_row, row in enumerate(rows):
+                swept.set(new_row, column.values[column.codes[row]])
+            self._columns[attr] = swept
+
+    def column(self, attr: str) -> Column:
+        """Return the column of attr, building it if needed; return None
+        when an object has no such attribute.
+        """
+        column = self._columns.get(attr)
+        if column is not None:
+            return column
+        with self._lock:
+            column = self._columns.get(attr)
+            if column is not None:
+                return column
+            column = Column(attr)
+            for row, obj_id in enumerate(self._ids):
+                obj = self._store.get(obj_id) if self._live[row] else None
+                try:
+                    column.set(row, None if obj is None
+                               else getattr(obj, attr))
+                except AttributeError:
+                    return None
+            self._columns[attr] = column
+            return column
+
+    def _mask(self, column: Column, codes: List[int]) -> Any:
+        """Return the mask of the rows whose code is in codes.
+        """
+        if numpy is not None:
+            return numpy.isin(numpy.frombuffer(column.codes, dtype='l'),
+                              codes)
+        if len(codes) == 1:
+            return bytes(map(codes[0].__eq__, column.codes))
+        return bytes(map(frozenset(codes).__contains__, column.codes))
+
+    def select(self, attributes: dict) -> Tuple[List[str], dict]:
+        """Return the IDs of the objects with matching attributes in
+        insertion order, and the number of distinct values evaluated by
+        attribute. Return None instead of the IDs when an attribute can't
+        be mirrored.
+        """
+        masks = []
+        distinct = {}
+        for attr, expected in attributes.items():
+            column = self.column(attr)
+            if column is None:
+                return None, distinct
+            codes = column.matching_codes(expected)
+            distinct[attr] = len(column.values)
+            if len(codes) == 0:
+                return [], distinct
+            masks.append(self._mask(column, codes))
+
+        if numpy is not None:
+            mask = numpy.frombuffer(self._live, dtype=numpy.uint8) != 0
+            for other in masks:
+                mask &= other
+            ids = [self._ids[row] for row in numpy.flatnonzero(mask)]
+        else:
+            mask = self._live
+            for other in masks:
+                mask = bytes(map(operator.and_, mask, other))
+            ids = list(compress(self._ids, mask))
+        return ids, distinct
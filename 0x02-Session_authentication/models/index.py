@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Index module.
+"""
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Tuple
+
+
+class HashIndex():
+    """Equality index of one attribute over the objects of a class.
+    """
+
+    def __init__(self, attribute: str):
+        """Initialize an empty index on attribute.
+        """
+        self.attribute = attribute
+        self._buckets = {}
+        self._values = {}
+        self._unhashable = {}
+
+    def add(self, obj: Any):
+        """(Re)index an object under the current value of the attribute.
+        """
+        self.add_value(obj.id, getattr(obj, self.attribute, None))
+
+    def add_value(self, obj_id: str, value: Any):
+        """(Re)index an object ID under a value.
+        """
+        self.discard(obj_id)
+        try:
+            self._buckets.setdefault(value, {})[obj_id] = None
+            self._values[obj_id] = value
+        except TypeError:
+            self._unhashable[obj_id] = None
+
+    def discard(self, obj_id: str):
+        """Remove an object from the index, if present.
+        """
+        if obj_id in self._values:
+            value = self._values.pop(obj_id)
+            bucket = self._buckets[value]
+            del bucket[obj_id]
+            if len(bucket) == 0:
+                del self._buckets[value]
+        else:
+            self._unhashable.pop(obj_id, None)
+
+    def clear(self):
+        """Remove every object from the index.
+        """
+        self._buckets.clear()
+        self._values.clear()
+        self._unhashable.clear()
+
+    def lookup(self, value: Any) -> Optional[Iterable[str]]:
+        """Return the IDs of the objects which may have this value,
+        or None when the value can't be looked up.
+        """
+        try:
+            bucket = self._buckets.get(value, {})
+        except TypeError:
+            return None
+        if len(self._unhashable) == 0:
+            return bucket.keys()
+        return list(bucket.keys()) + list(self._unhashable.keys())
+
+
+class SortedIndex():
+    """Ordered index of one attribute over the objects of a class, keyed
+    by (value, ID) so that ties keep a stable order.
+    """
+
+    def __init__(self, attribute: str):
+        """Initialize an empty index on attribute.
+        """
+        self.attribute = attribute
+        self._keys = []
+        self._values = {}
+
+    @staticmethod
+    def normalize(value: Any) -> Any:
+        """Return value in the form used as a key: ISO strings, as found
+        in serialized records, are parsed into datetimes.
+        """
+        if type(value) is str:
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                return value
+        return value
+
+    def add(self, obj: Any):
+        """(Re)index an object under the current value of the attribute.
+        """
+        self.add_value(obj.id, getattr(obj, self.attribute, None))
+
+    def add_value(self, obj_id: str, value: Any):
+        """(Re)index an object ID under a value; None is not indexed.
+        """
+        value = self.normalize(value)
+        if self._values.get(obj_id, None) == value and value is not None:
+            return
+        self.discard(obj_id)
+        if value is None:
+            return
+        insort(self._keys, (value, obj_id))
+        self._values[obj_id] = value
+
+    def discard(self, obj_id: str):
+        """Remove an object from the index, if present.
+        """
+        if obj_id not in self._values:
+            return
+        key = (self._values.pop(obj_id), obj_id)
+        del self._keys[bisect_left(self._keys, key)]
+
+    def clear(self):
+        """Remove every object from the index.
+        """
+        self._keys.clear()
+        self._values.clear()
+
+    def __len__(self) -> int:
+        """Number of indexed objects.
+        """
+        return len(self._keys)
+
+    def keys_after(self, key: Optional[Tuple[Any, str]],
+                   size: int) -> List[Tuple[Any, str]]:
+        """Return at most size (value, ID) keys following key, or from the
+        start when key is None.
+        """
+        start = 0 if key is None else bisect_right(self._keys, key)
+        return self._keys[start:start + size]
+
+    def range(self, start: Any = None, end: Any = None) -> List[str]:
+        """Return the IDs whose value is in [start, end), in key order;
+        a None bound leaves that side open.
+        """
+        lo = 0 if start is None else bisect_left(self._keys, (start,))
+        hi = len(self._keys) if end is None \
+            else bisect_left(self._keys, (end,))
+        return [obj_id for _, obj_id in self._keys[lo:hi]]
+
+    def equal(self, value: Any) -> List[str]:
+        """Return the IDs whose value equals value, in ID order.
+        """
+        value = self.normalize(value)
+        ids = []
+        for key in self._keys[bisect_left(self._keys, (value,)):]:
+            if key[0] != value:
+                break
+            ids.append(key[1])
+        return ids
+
+    def prefix(self, prefix: str) -> List[str]:
+        """Return the IDs whose string value starts with prefix, in key
+        order.
+        """
+        ids = []
+        for key in self._keys[bisect_left(self._keys, (prefix,)):]:
+            if type(key[0]) is not str or not key[0].startswith(prefix):
+                break
+            ids.append(key[1])
+        return ids
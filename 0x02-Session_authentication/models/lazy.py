@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Lazy store module.
+"""
+import threading
+from typing import Any, Iterator, List, Optional, Tuple
+
+from models.snapshot import serialize_record
+
+
+class LazyStore():
+    """Ordered mapping of IDs to the objects of one class, holding the
+    serialized records loaded from file and building each object on
+    first access only.
+    """
+
+    def __init__(self, cls: type):
+        """Initialize an empty store for the objects of cls.
+        """
+        self._cls = cls
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _hydrate(self, obj_id: str, value: Any) -> Any:
+        """Build and cache the object of a record, if not done yet.
+
+        Readers hydrate concurrently, so the entry is checked again under
+        the store lock: each record is built once, by a single reader.
+        """
+        if type(value) is not dict:
+            return value
+        with self._lock:
+            value = self._entries.get(obj_id, value)
+            if type(value) is dict:
+                value = self._cls(**value)
+                self._entries[obj_id] = value
+        return value
+
+    def set_record(self, obj_id: str, record: dict):
+        """Store the serialized record of an object.
+        """
+        self._entries[obj_id] = record
+
+    def hydrated(self) -> int:
+        """Return the number of objects built so far.
+        """
+        return sum(1 for v in self._entries.values() if type(v) is not dict)
+
+    def __len__(self) -> int:
+        """Number of objects, built or not.
+        """
+        return len(self._entries)
+
+    def __contains__(self, obj_id: str) -> bool:
+        """Whether an object with this ID is stored.
+        """
+        return obj_id in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the IDs.
+        """
+        return iter(list(self._entries))
+
+    def keys(self) -> List[str]:
+        """Return the IDs.
+        """
+        return list(self._entries)
+
+    def __getitem__(self, obj_id: str) -> Any:
+        """Return the object with this ID, building it if needed.
+        """
+        return self._hydrate(obj_id, self._entries[obj_id])
+
+    def get(self, obj_id: str, default: Any = None) -> Any:
+        """Return the object with this ID, or default.
+        """
+        value = self._entries.get(obj_id)
+        if value is None:
+            return default
+        return self._hydrate(obj_id, value)
+
+    def __setitem__(self, obj_id: str, obj: Any):
+        """Store a built object.
+        """
+        self._entries[obj_id] = obj
+
+    def __delitem__(self, obj_id: str):
+        """Remove an object.
+        """
+        del self._entries[obj_id]
+
+    def values(self) -> List[Any]:
+        """Return every object, building the missing ones.
+        """
+        return [self._hydrate(k, v) for k, v in list(self._entries.items())]
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """Return every (ID, object) pair, building the missing objects.
+        """
+        return [(k, self._hydrate(k, v))
+                for k, v in list(self._entries.items())]
+
+    @staticmethod
+    def _serialize(value: Any) -> dict:
+        """Serialize an object, built or not.
+        """
+        if type(value) is not dict:
+            return value.to_json(True)
+        return serialize_record(value)
+
+    def serialized(self, obj_id: str) -> Optional[dict]:
+        """Return the serialized object with this ID without building it,
+        or None.
+        """
+        value = self._entries.get(obj_id)
+        if value is None:
+            return None
+        return self._serialize(value)
+
+    def serialized_items(self) -> Iterator[Tuple[str, dict]]:
+        """Yield every (ID, serialized object) pair without building
+        the objects never accessed.
+        """
+        for obj_id, value in list(self._entries.items()):
+            yield obj_id, self._serialize(value)
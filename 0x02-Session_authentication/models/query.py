@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Search operators module.
+
+Values of the attributes dict given to Base.search are matched for
+equality, unless they are one of the operators below:
+
+    User.search({'email': Prefix('bob'), 'last_name': IEq('dylan')})
+"""
+from typing import Any, Iterable
+
+from models.index import SortedIndex
+
+
+class Operator():
+    """Base class of the search operators.
+    """
+
+    def matches(self, value: Any) -> bool:
+        """Whether an attribute value satisfies the operator.
+        """
+        raise NotImplementedError()
+
+    def __repr__(self) -> str:
+        """Representation used by Base.explain.
+        """
+        args = ", ".join(repr(v) for v in self.__dict__.values())
+        return "{}({})".format(self.__class__.__name__, args)
+
+
+class In(Operator):
+    """Value is one of the given values.
+    """
+
+    def __init__(self, values: Iterable):
+        """Initialize the operator with the accepted values.
+        """
+        self.values = list(values)
+
+    def matches(self, value: Any) -> bool:
+        """Whether value is one of the accepted values.
+        """
+        return value in self.values
+
+
+class Prefix(Operator):
+    """Value is a string starting with the given prefix.
+    """
+
+    def __init__(self, prefix: str):
+        """Initialize the operator with the prefix.
+        """
+        self.prefix = prefix
+
+    def matches(self, value: Any) -> bool:
+        """Whether value starts with the prefix.
+        """
+        return type(value) is str and value.startswith(self.prefix)
+
+
+class IEq(Operator):
+    """Value is a string equal to the given one, ignoring case.
+    """
+
+    def __init__(self, value: str):
+        """Initialize the operator with the expected value.
+        """
+        self.value = value.casefold()
+
+    def matches(self, value: Any) -> bool:
+        """Whether value equals the expected value, ignoring case.
+        """
+        return type(value) is str and value.casefold() == self.value
+
+
+class Range(Operator):
+    """Value is in [start, end); a None bound leaves that side open.
+    Timestamps may be given as datetimes or ISO strings.
+    """
+
+    def __init__(self, start: Any = None, end: Any = None):
+        """Initialize the operator with its bounds.
+        """
+        self.start = SortedIndex.normalize(start)
+        self.end = SortedIndex.normalize(end)
+
+    def matches(self, value: Any) -> bool:
+        """Whether value is within the bounds.
+        """
+        value = SortedIndex.normalize(value)
+        if value is None:
+            return False
+        try:
+            return (self.start is None or value >= self.start) and \
+                (self.end is None or value < self.end)
+        except TypeError:
+            return False
+
+
+def matches(obj: Any, attributes: dict) -> bool:
+    """Whether obj has every attribute value of attributes.
+    """
+    for k, v in attributes.items():
+        if isinstance(v, Operator):
+            if not v.matches(getattr(obj, k)):
+                return False
+        elif (getattr(obj, k) != v):
+            return False
+    return True
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Reader/writer and file lock module.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class RWLock():
+    """Lock shared by any number of readers or held by a single writer.
+
+    Waiting writers take precedence over new readers so that a steady
+    flow of reads cannot starve them. Both sides are reentrant, and the
+    writer may also read.
+    """
+
+    def __init__(self):
+        """Initialize an unlocked lock.
+        """
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def reading(self) -> Iterator[None]:
+        """Hold the lock as a reader for the duration of the block.
+        """
+        depth = getattr(self._local, 'depth', 0)
+        if depth > 0 or self._writer == threading.get_ident():
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth = depth
+            return
+
+        with self._cond:
+            while self._writer is not None or self._waiting_writers > 0:
+                self._cond.wait()
+            self._readers += 1
+        self._local.depth = 1
+        try:
+            yield
+        finally:
+            self._local.depth = 0
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def writing(self) -> Iterator[None]:
+        """Hold the lock as the only writer for the duration of the block.
+        """
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers > 0:
+                        self._cond.wait()
+                finally:
+                    self._waiting_writers -= 1
+                self._writer = me
+            self._writer_depth += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer_depth -= 1
+                if self._writer_depth == 0:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
+class FileLock():
+    """Exclusive lock shared with other processes through flock on a
+    file, where fcntl is available, and reentrant within this process.
+    """
+
+    def __init__(self, file_path: str):
+        """Initialize an unlocked lock on file_path, created if needed.
+        """
+        self.file_path = file_path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    @contextmanager
+    def holding(self) -> Iterator[None]:
+        """Hold the lock for the duration of the block.
+        """
+        with self._lock:
+            if self._depth == 0:
+                self._file = open(self.file_path, 'a')
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._file.close()
+                    self._file = None
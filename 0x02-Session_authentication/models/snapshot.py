@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Binary snapshot module.
+
+A binary snapshot stores the objects of one class column by column:
+
+    magic | header | column 1 | column 2 | ...
+
+where the header and every column are prefixed by their length as an
+unsigned 32-bit integer. The header is a JSON object giving the number of
+objects and the name and kind of every column. Timestamp columns hold
+epoch seconds as signed 64-bit integers, other columns a JSON list.
+"""
+import json
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterator
+
+
+MAGIC = b"BDB\x01"
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+TIMESTAMP_ATTRIBUTES = ('created_at', 'updated_at')
+EPOCH = datetime(1970, 1, 1)
+NULL_TIMESTAMP = -2 ** 63
+_length = struct.Struct("<I")
+
+
+def _to_epoch(value) -> int:
+    """Convert a datetime or a TIMESTAMP_FORMAT string to epoch seconds.
+    """
+    if value is None:
+        return NULL_TIMESTAMP
+    if type(value) is not datetime:
+        value = datetime.fromisoformat(value)
+    return (value - EPOCH) // timedelta(seconds=1)
+
+
+def _from_epoch(value: int) -> datetime:
+    """Convert epoch seconds back to a naive UTC datetime.
+    """
+    if value == NULL_TIMESTAMP:
+        return None
+    return EPOCH + timedelta(seconds=value)
+
+
+def serialize_record(record: dict) -> dict:
+    """Return a copy of a decoded object with its timestamps formatted as
+    in .db_<Class>.json files.
+    """
+    record = dict(record)
+    for k, v in record.items():
+        if type(v) is datetime:
+            record[k] = v.strftime(TIMESTAMP_FORMAT)
+    return record
+
+
+def encode(objs_json: Dict[str, dict]) -> bytes:
+    """Encode serialized objects, keyed by ID, as a binary snapshot.
+    Timestamps may be datetimes or TIMESTAMP_FORMAT strings.
+    """
+    names = []
+    for obj_json in objs_json.values():
+        for key in obj_json:
+            if key not in names:
+                names.append(key)
+    rows = list(objs_json.values())
+
+    columns = []
+    payloads = []
+    for name in names:
+        values = [row.get(name) for row in rows]
+        if name in TIMESTAMP_ATTRIBUTES:
+            columns.append([name, 'ts'])
+            ints = array('q', map(_to_epoch, values))
+            if sys.byteorder != 'little':
+                ints.byteswap()
+            payloads.append(ints.tobytes())
+        else:
+            columns.append([name, 'json'])
+            payloads.append(json.dumps(values).encode())
+
+    header = json.dumps({'count': len(rows), 'columns': columns}).encode()
+    chunks = [MAGIC, _length.pack(len(header)), header]
+    for payload in payloads:
+        chunks.append(_length.pack(len(payload)))
+        chunks.append(payload)
+    return b"".join(chunks)
+
+
+def decode(data: bytes) -> Iterator[dict]:
+    """Decode a binary snapshot into one dict per object, timestamps
+    being datetimes.
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a binary snapshot")
+    view = memoryview(data)
+    offset = len(MAGIC)
+
+    def chunk():
+        nonlocal offset
+        size, = _length.unpack_from(view, offset)
+        offset += _length.size
+        payload = view[offset:offset + size]
+        offset += size
+        return payload
+
+    header = json.loads(bytes(chunk()))
+    names = []
+    columns = []
+    for name, kind in header['columns']:
+        payload = chunk()
+        if kind == 'ts':
+            ints = array('q')
+            ints.frombytes(payload)
+            if sys.byteorder != 'little':
+                ints.byteswap()
+            values = [_from_epoch(value) for value in ints]
+        else:
+            values = json.loads(bytes(payload))
+        names.append(name)
+        columns.append(values)
+
+    for values in zip(*columns):
+        yield dict(zip(names, values))
+
+
+def read(file_path: str) -> Iterator[dict]:
+    """Read the objects of a binary snapshot file.
+    """
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    return decode(data)
+
+
+def json_to_binary(src: str, dst: str):
+    """Convert a .db_<Class>.json file to a binary snapshot.
+    """
+    with open(src, 'r') as f:
+        objs_json = json.load(f)
+    with open(dst, 'wb') as f:
+        f.write(encode(objs_json))
+
+
+def binary_to_json(src: str, dst: str):
+    """Convert a binary snapshot to a .db_<Class>.json file.
+    """
+    objs_json = {}
+    for obj in read(src):
+        objs_json[obj['id']] = serialize_record(obj)
+    with open(dst, 'w') as f:
+        json.dump(objs_json, f)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: {} <src> <dst>".format(sys.argv[0]), file=sys.stderr)
+        sys.exit(1)
+    if sys.argv[1].endswith('.json'):
+        json_to_binary(sys.argv[1], sys.argv[2])
+    else:
+        binary_to_json(sys.argv[1], sys.argv[2])
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""Storage backend module.
+
+Base.get, search, save, remove, count and all are delegated to the
+backend selected by MODELS_BACKEND:
+
+- 'json' (default): objects held in DATA and persisted to .db_<Class>
+  files, see models.base.JSONBackend
+- 'sqlite': objects stored in the SQLite database MODELS_SQLITE_PATH,
+  shared by every process opening it, see SQLiteBackend
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from os import getenv
+from typing import Any, List, Optional, Tuple
+
+from models.query import In, Operator, Prefix, Range, matches
+from models.snapshot import TIMESTAMP_ATTRIBUTES, TIMESTAMP_FORMAT
+
+
+SQLITE_PATH = getenv('MODELS_SQLITE_PATH', '.db.sqlite3')
+SQLITE_TIMEOUT = float(getenv('MODELS_SQLITE_TIMEOUT', '30'))
+# Types stored as is in the indexed columns; other values are stored as
+# NULL there and only matched against the serialized object
+SCALAR_TYPES = (str, int, float)
+
+
+class Backend():
+    """Interface of the storage backends.
+
+    Methods receive the model class, or the object for save and remove.
+    """
+    # Whether the objects live in DATA, where the indexes of models.base
+    # and its paginated scans apply
+    local = False
+
+    def load(self, cls: type):
+        """Prepare the storage of cls and load its objects if needed.
+        """
+        raise NotImplementedError()
+
+    def count(self, cls: type) -> int:
+        """Count the objects of cls.
+        """
+        raise NotImplementedError()
+
+    def get(self, cls: type, obj_id: str) -> Any:
+        """Return the object of cls with this ID, or None.
+        """
+        raise NotImplementedError()
+
+    def search(self, cls: type, attributes: dict) -> List[Any]:
+        """Return the objects of cls with matching attributes, in
+        insertion order.
+        """
+        raise NotImplementedError()
+
+    def save(self, obj: Any):
+        """Update the updated_at of an object and store it.
+        """
+        raise NotImplementedError()
+
+    def remove(self, obj: Any):
+        """Remove an object, if stored.
+        """
+        raise NotImplementedError()
+
+    def candidates(self, cls: type, attributes: dict) -> Optional[List[Any]]:
+        """Return a superset of the objects with matching attributes when
+        it is cheaper than a full scan, None otherwise.
+        """
+        return None
+
+    def scan(self, cls: type, key: Optional[Tuple[datetime, str]],
+             size: int) -> List[Any]:
+        """Return at most size objects of cls following key in
+        (created_at, id) order, from the start when key is None.
+        """
+        raise NotImplementedError()
+
+    def explain(self, cls: type, attributes: dict) -> dict:
+        """Run a search and describe how it was evaluated.
+        """
+        raise NotImplementedError()
+
+
+class SQLiteBackend(Backend):
+    """Objects stored in one SQLite table per class.
+
+    A table holds the serialized object in its data column, plus one
+    indexed column per attribute of INDEXED, SORTED and created_at.
+    Search predicates on these columns, or on the FIELDS of the data
+    column, are pushed down to SQL, and every row found is matched again
+    against the object, so SQL only narrows the rows built. The database
+    runs in WAL mode: readers of any thread or process never block on the
+    single writer.
+
+    Statements always use the same SQL text for a given class and query
+    shape, so that sqlite3 reuses its prepared statements.
+    """
+
+    def __init__(self, db_path: str = SQLITE_PATH):
+        """Initialize the backend on the database file db_path.
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._tables = {}
+        self._tables_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return the connection of the current thread, opening a new one
+        in a new thread or after a fork.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=SQLITE_TIMEOUT,
+                                   isolation_level=None,
+                                   cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _columns(cls: type) -> Tuple[str, ...]:
+        """Return the indexed columns of cls.
+        """
+        columns = ['created_at']
+        for attr in cls.INDEXED + cls.SORTED:
+            if attr not in columns and attr not in ('id', 'data'):
+                columns.append(attr)
+        return tuple(columns)
+
+    @staticmethod
+    def _fields(cls: type) -> Tuple[str, ...]:
+        """Return the attributes declared in the FIELDS of cls and of its
+        bases, which are keys of the serialized object.
+        """
+        fields = []
+        for klass in type.mro(cls):
+            fields.extend(klass.__dict__.get('FIELDS', ()))
+        return tuple(fields)
+
+    def _table(self, cls: type) -> dict:
+        """Create the table of cls if needed and return its statements.
+        """
+        s_class = cls.__name__
+        table = self._tables.get(s_class)
+        if table is not None:
+            return table
+        with self._tables_lock:
+            if s_class in self._tables:
+                return self._tables[s_class]
+            columns = self._columns(cls)
+            conn = self._connection()
+            conn.execute('CREATE TABLE IF NOT EXISTS "{}" ('
+                         'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                         'id TEXT NOT NULL UNIQUE, {}, data TEXT NOT NULL)'
+                         .format(s_class, ", ".join(
+                             '"{}"'.format(c) for c in columns)))
+            for column in columns:
+                # created_at orders the paginated scans, ties by id
+                keys = '"created_at", id' if column == 'created_at' \
+                    else '"{}"'.format(column)
+                conn.execute('CREATE INDEX IF NOT EXISTS "ix_{0}_{1}" '
+                             'ON "{0}" ({2})'.format(s_class, column, keys))
+            names = ", ".join('"{}"'.format(c) for c in columns)
+            table = {
+                'columns': columns,
+                'upsert': 'INSERT INTO "{0}" (id, {1}, data) '
+                          'VALUES (?, {2}?) ON CONFLICT(id) DO UPDATE SET '
+                          '{3}, data = excluded.data'.format(
+                              s_class, names, "?, " * len(columns),
+                              ", ".join('"{0}" = excluded."{0}"'.format(c)
+                                        for c in columns)),
+                'delete': 'DELETE FROM "{}" WHERE id = ?'.format(s_class),
+                'get': 'SELECT data FROM "{}" WHERE id = ?'.format(s_class),
+                'count': 'SELECT COUNT(*) FROM "{}"'.format(s_class),
+                'scan': 'SELECT data FROM "{0}" WHERE "created_at" > ? OR '
+                        '("created_at" = ? AND id > ?) '
+                        'ORDER BY "created_at", id LIMIT ?'.format(s_class),
+                'scan_first': 'SELECT data FROM "{}" ORDER BY "created_at", '
+                              'id LIMIT ?'.format(s_class),
+            }
+            self._tables[s_class] = table
+            return table
+
+    @staticmethod
+    def _column_value(value: Any) -> Any:
+        """Return value as stored in an indexed column, or None when it
+        is not stored there.
+        """
+        if type(value) is datetime:
+            return value.strftime(TIMESTAMP_FORMAT)
+        if isinstance(value, SCALAR_TYPES):
+            return value
+        return None
+
+    @staticmethod
+    def _build(cls: type, data: str) -> Any:
+        """Build an object from its data column.
+        """
+        return cls(**json.loads(data))
+
+    def _where(self, cls: type, attributes: dict
+               ) -> Tuple[List[str], List[Any]]:
+        """Translate the predicates on indexed columns, or on FIELDS read
+        from the data column, to SQL conditions, each one selecting a
+        superset of the matching rows.
+        """
+        columns = self._columns(cls)
+        fields = self._fields(cls)
+        conditions = []
+        params = []
+        for attr, value in attributes.items():
+            if attr in columns:
+                column = '"{}"'.format(attr)
+            elif attr in fields and attr.isidentifier():
+                column = "json_extract(data, '$.{}')".format(attr)
+            else:
+                continue
+            if isinstance(value, Range):
+                if attr not in TIMESTAMP_ATTRIBUTES:
+                    continue
+                bounds = []
+                for op, bound in ((">=", value.start), ("<=", value.end)):
+                    if type(bound) is datetime:
+                        # timestamps are stored to the second: compare
+                        # truncated bounds, inclusively
+                        bounds.append(("{} {} ?".format(column, op),
+                                       bound.strftime(TIMESTAMP_FORMAT)))
+                    elif bound is not None:
+                        break
+                else:
+                    for condition, param in bounds:
+                        conditions.append(condition)
+                        params.append(param)
+            elif isinstance(value, Prefix):
+                prefix = value.prefix
+                if type(prefix) is not str or prefix == "" or \
+                        attr in TIMESTAMP_ATTRIBUTES or \
+                        ord(prefix[-1]) >= 0x10ffff:
+                    continue
+                conditions.append("{0} >= ? AND {0} < ?".format(column))
+                params.append(prefix)
+                params.append(prefix[:-1] + chr(ord(prefix[-1]) + 1))
+            elif isinstance(value, In):
+                if not all(isinstance(v, SCALAR_TYPES)
+                           for v in value.values):
+                    continue
+                conditions.append("{} IN ({})".format(
+                    column, ", ".join("?" * len(value.values))))
+                params.extend(value.values)
+            elif not isinstance(value, Operator):
+                stored = self._column_value(value)
+                if value is not None and stored is None:
+                    continue
+                if value is None:
+                    conditions.append("{} IS NULL".format(column))
+                else:
+                    conditions.append("{} = ?".format(column))
+                    params.append(stored)
+        return conditions, params
+
+    def _select(self, cls: type, conditions: List[str]) -> str:
+        """Return the query selecting the rows of cls satisfying every
+        condition, in insertion order.
+        """
+        sql = 'SELECT data FROM "{}"'.format(cls.__name__)
+        if len(conditions) > 0:
+            sql += " WHERE " + " AND ".join(conditions)
+        return sql + " ORDER BY seq"
+
+    def load(self, cls: type):
+        """Create the table and indexes of cls if needed.
+        """
+        self._table(cls)
+
+    def count(self, cls: type) -> int:
+        """Count the rows of cls.
+        """
+        sql = self._table(cls)['count']
+        return self._connection().execute(sql).fetchone()[0]
+
+    def get(self, cls: type, obj_id: str) -> Any:
+        """Return the object of cls with this ID, or None.
+        """
+        sql = self._table(cls)['get']
+        row = self._connection().execute(sql, (obj_id,)).fetchone()
+        if row is None:
+            return None
+        return self._build(cls, row[0])
+
+    def search(self, cls: type, attributes: dict) -> List[Any]:
+        """Return the objects of cls with matching attributes.
+        """
+        self._table(cls)
+        conditions, params = self._where(cls, attributes)
+        cursor = self._connection().execute(
+            self._select(cls, conditions), params)
+        objs = (self._build(cls, data) for data, in cursor)
+        return [obj for obj in objs if matches(obj, attributes)]
+
+    def save(self, obj: Any):
+        """Write an object in a single statement.
+        """
+        table = self._table(type(obj))
+        obj.updated_at = datetime.utcnow()
+        record = obj.to_json(True)
+        params = [obj.id]
+        for column in table['columns']:
+            params.append(self._column_value(record.get(column)))
+        params.append(json.dumps(record))
+        self._connection().execute(table['upsert'], params)
+
+    def remove(self, obj: Any):
+        """Delete the row of an object.
+        """
+        sql = self._table(type(obj))['delete']
+        self._connection().execute(sql, (obj.id,))
+
+    def candidates(self, cls: type, attributes: dict) -> Optional[List[Any]]:
+        """Return the matching objects when a predicate can be evaluated
+        by SQLite, None otherwise.
+        """
+        if len(self._where(cls, attributes)[0]) == 0:
+            return None
+        return self.search(cls, attributes)
+
+    def scan(self, cls: type, key: Optional[Tuple[datetime, str]],
+             size: int) -> List[Any]:
+        """Return at most size objects following key in (created_at, id)
+        order, using the index on these columns.
+        """
+        table = self._table(cls)
+        conn = self._connection()
+        if key is None:
+            cursor = conn.execute(table['scan_first'], (size,))
+        else:
+            value = self._column_value(key[0])
+            cursor = conn.execute(table['scan'], (value, value, key[1], size))
+        return [self._build(cls, data) for data, in cursor]
+
+    def explain(self, cls: type, attributes: dict) -> dict:
+        """Run a search and return the SQLite query plan ('steps') with
+        the number of rows examined and of objects matched.
+        """
+        self._table(cls)
+        conditions, params = self._where(cls, attributes)
+        sql = self._select(cls, conditions)
+        conn = self._connection()
+        steps = [row[-1] for row in
+                 conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        examined = 0
+        matched = 0
+        for data, in conn.execute(sql, params):
+            examined += 1
+            if matches(self._build(cls, data), attributes):
+                matched += 1
+        return {'plan': 'sqlite', 'sql': sql, 'steps': steps,
+                'examined': examined, 'matched': matched}
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Unit tests of the file-backed storage of models.base.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from models import base
+from models.user import User
+
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@unittest.skipUnless(base.BACKEND.local, "objects are not held in DATA")
+class StorageTestCase(unittest.TestCase):
+    """Runs each test in an empty directory with changes written at once.
+    """
+    STORAGE = 'json'
+    SNAPSHOT_FORMAT = 'json'
+
+    def setUp(self):
+        """Move to an empty directory and load the empty store.
+        """
+        cwd = os.getcwd()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        os.chdir(tmp.name)
+        self.addCleanup(os.chdir, cwd)
+        for name, value in (('STORAGE', self.STORAGE),
+                            ('SNAPSHOT_FORMAT', self.SNAPSHOT_FORMAT),
+                            ('FLUSH_INTERVAL', 0),
+                            ('RELOAD_INTERVAL', 0)):
+            patcher = mock.patch.object(base, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        User.load_from_file()
+
+    def emails(self) -> set:
+        """Return the emails of the users in DATA.
+        """
+        return {user.email for user in User.all()}
+
+    def reload(self) -> set:
+        """Load the users from file and return their emails.
+        """
+        User.load_from_file()
+        return self.emails()
+
+    def external(self, code: str):
+        """Run code in another process sharing the files, after it loaded
+        the users.
+        """
+        env = dict(os.environ, PYTHONPATH=PACKAGE_DIR,
+                   MODELS_STORAGE=self.STORAGE,
+                   MODELS_SNAPSHOT_FORMAT=self.SNAPSHOT_FORMAT,
+                   MODELS_FLUSH_INTERVAL='0')
+        subprocess.check_call([sys.executable, '-c', "\n".join((
+            "from models.user import User",
+            "User.load_from_file()",
+            code))], env=env)
+
+
+class TestRoundTrip(StorageTestCase):
+    """Saved and removed objects are read back by load_from_file.
+    """
+
+    def test_save_remove_reload(self):
+        """Creations, updates and removals survive a reload.
+        """
+        users = [User(email="u{}@x.io".format(i)) for i in range(3)]
+        for user in users:
+            user.save()
+        users[0].first_name = "Bob"
+        users[0].save()
+        users[1].remove()
+
+        self.assertEqual(self.reload(), {"u0@x.io", "u2@x.io"})
+        self.assertEqual(User.get(users[0].id).to_json(),
+                         users[0].to_json())
+        self.assertIsNone(User.get(users[1].id))
+
+    def test_no_journal_file(self):
+        """Only the snapshot and the lock file are written.
+        """
+        User(email="a@x.io").save()
+        names = set(os.listdir("."))
+        self.assertIn(User._snapshot_path(), names)
+        self.assertNotIn(".db_User.journal", names)
+
+
+class TestRoundTripBinary(TestRoundTrip):
+    """Round trips through the binary snapshot format.
+    """
+    SNAPSHOT_FORMAT = 'binary'
+
+
+class TestJournal(StorageTestCase):
+    """The journal is replayed on load and compacted into the snapshot.
+    """
+    STORAGE = 'journal'
+
+    def journal(self) -> list:
+        """Return the lines of the journal file.
+        """
+        with open(".db_User.journal", 'rb') as f:
+            return f.read().splitlines(True)
+
+    def test_save_remove_reload(self):
+        """Changes are appended to the journal and replayed on load.
+        """
+        kept, removed = User(email="kept@x.io"), User(email="gone@x.io")
+        kept.save()
+        removed.save()
+        removed.remove()
+
+        ops = [json.loads(line)['op'] for line in self.journal()]
+        self.assertEqual(ops, ['upsert', 'upsert', 'delete'])
+        self.assertEqual(self.reload(), {"kept@x.io"})
+
+    def test_torn_write_ends_the_journal(self):
+        """A partly written last entry is ignored on load.
+        """
+        User(email="whole@x.io").save()
+        torn = json.dumps({'op': 'upsert', 'id': 'torn',
+                           'obj': {'id': 'torn', 'email': "torn@x.io"}})
+        with open(".db_User.journal", 'a') as f:
+            f.write(torn[:len(torn) // 2])
+
+        self.assertEqual(self.reload(), {"whole@x.io"})
+
+    def test_compaction(self):
+        """Reaching the threshold folds the journal into the snapshot.
+        """
+        with mock.patch.object(base, 'JOURNAL_COMPACT_THRESHOLD', 3):
+            for i in range(3):
+                User(email="u{}@x.io".format(i)).save()
+        self.assertEqual(self.journal(), [])
+        self.assertEqual(len(list(User._read_snapshot())), 3)
+
+        User(email="u3@x.io").save()
+        self.assertEqual(len(self.journal()), 1)
+        self.assertEqual(self.reload(),
+                         {"u{}@x.io".format(i) for i in range(4)})
+
+    def test_own_entries_not_applied_again(self):
+        """refresh leaves the objects this process wrote untouched.
+        """
+        user = User(email="mine@x.io")
+        user.save()
+        user.first_name = "Me"
+        user.save()
+        User.refresh()
+        self.assertIs(User.get(user.id), user)
+
+
+class TestJournalBinary(TestJournal):
+    """Journal on top of the binary snapshot format.
+    """
+    SNAPSHOT_FORMAT = 'binary'
+
+
+class TestRefresh(StorageTestCase):
+    """refresh applies the changes written by other processes.
+    """
+
+    def test_external_changes(self):
+        """Objects created and updated elsewhere are merged, unchanged
+        objects are kept as they are.
+        """
+        kept, changed = User(email="kept@x.io"), User(email="changed@x.io")
+        kept.save()
+        changed.save()
+        self.external("\n".join((
+            "User(email='theirs@x.io').save()",
+            "user = User.search({'email': 'changed@x.io'})[0]",
+            "user.first_name = 'Ext'",
+            "user.save()")))
+        User.refresh()
+
+        self.assertEqual(self.emails(),
+                         {"kept@x.io", "changed@x.io", "theirs@x.io"})
+        self.assertIs(User.get(kept.id), kept)
+        self.assertEqual(User.get(changed.id).first_name, "Ext")
+
+    def test_external_removal(self):
+        """Objects removed elsewhere are removed from DATA.
+        """
+        user = User(email="gone@x.io")
+        user.save()
+        self.external("User.get('{}').remove()".format(user.id))
+        User.refresh()
+        self.assertIsNone(User.get(user.id))
+
+    def test_save_keeps_external_changes(self):
+        """Rewriting the snapshot doesn't drop what others wrote.
+        """
+        User(email="first@x.io").save()
+        self.external("User(email='theirs@x.io').save()")
+        User(email="second@x.io").save()
+        self.assertEqual(self.reload(),
+                         {"first@x.io", "theirs@x.io", "second@x.io"})
+
+
+class TestRefreshJournal(TestRefresh):
+    """refresh reads the journal tail, or everything after a compaction.
+    """
+    STORAGE = 'journal'
+
+    def test_external_compaction(self):
+        """A snapshot rewritten elsewhere is read again in full.
+        """
+        user = User(email="mine@x.io")
+        user.save()
+        self.external("\n".join((
+            "User(email='theirs@x.io').save()",
+            "User.get('{}').remove()".format(user.id),
+            "User.compact()")))
+        self.assertEqual(os.path.getsize(".db_User.journal"), 0)
+        User.refresh()
+        self.assertEqual(self.emails(), {"theirs@x.io"})
+
+
+if __name__ == "__main__":
+    unittest.main()
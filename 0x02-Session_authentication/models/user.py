@@ -2,12 +2,18 @@
 """User module.
 """
 import hashlib
-from models.base import Base
+from models.base import Base, COMPACT
 
 
 class User(Base):
     """User class.
     """
+    INDEXED = ('email',)
+    SORTED = ('updated_at',)
+    FIELDS = ('email', '_password', 'first_name', 'last_name')
+
+    if COMPACT:
+        __slots__ = FIELDS
 
     def __init__(self, *args: list, **kwargs: dict):
         """Initialize a User instance.
@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 """User session module. hhh
 """
-from models.base import Base
+from models.base import Base, COMPACT, interned_property
 
 
 class UserSession(Base):
     """User session class.
     """
+    INDEXED = ('session_id',)
+    FIELDS = ('user_id', 'session_id')
+
+    if COMPACT:
+        __slots__ = ('_user_id', 'session_id')
+        user_id = interned_property('_user_id')
 
     def __init__(self, *args: list, **kwargs: dict):
         """Initializes a User session instance.